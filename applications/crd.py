@@ -1,6 +1,18 @@
-from datetime import datetime
+from collections import Counter
+from datetime import date, datetime
+from typing import Iterator, List
 from fastapi import HTTPException
-from .models import Application
+from sqlalchemy import Table, bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+from .dialects import copy_rows, get_dialect_name
+from .models import (
+    DETAIL_COLUMNS,
+    Application,
+    ApplicationDetails,
+    SyncState,
+    to_epoch_day,
+)
+from .rollup import RollupDelta, apply_rollup_delta
 from .schemas import ApplicationBase
 import logging
 
@@ -18,17 +30,120 @@ def to_datetime_obj(date_str: str) -> datetime or None:
             return None
 
 
+def validate_application(item: dict) -> ApplicationBase:
+    """Validate the API response item against the application schema."""
+    try:
+        return ApplicationBase(**item)
+    except Exception as e:
+        error_logger.error(f"Invalid data: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid data: {str(e)}")
+
+
+class NotPlainValue(Exception):
+    """Raised if a value needs the coercion or error message of pydantic."""
+
+
+def take_plain_str(value) -> str:
+    if type(value) is not str:
+        raise NotPlainValue
+    return value
+
+
+def take_plain_int(value) -> int:
+    if type(value) is not int:
+        raise NotPlainValue
+    return value
+
+
+def take_plain_date(value) -> date:
+    if (
+        type(value) is not str
+        or len(value) != 10
+        or not value.isascii()
+        or value[4] != "-"
+        or value[7] != "-"
+    ):
+        raise NotPlainValue
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise NotPlainValue
+
+
+PLAIN_VALUE_TAKERS = {str: take_plain_str, int: take_plain_int, date: take_plain_date}
+
+
+def validate_plain_application(item: dict) -> dict:
+    """Validate an item which only has plain JSON values without pydantic.
+
+    Strings, integers, None for optional fields and dates as YYYY-MM-DD are
+    taken as they are, which gives the same result as ApplicationBase would.
+    Anything else raises NotPlainValue and is left to pydantic.
+    """
+    if type(item) is not dict:
+        raise NotPlainValue
+    application = {}
+    for name, field in ApplicationBase.__fields__.items():
+        value = item.get(name)
+        if value is None:
+            if field.required:
+                raise NotPlainValue
+            application[name] = field.default
+        else:
+            application[name] = PLAIN_VALUE_TAKERS[field.type_](value)
+    return application
+
+
+def validate_applications(items: List[dict]) -> List[dict]:
+    """Validate a batch of API response items into plain dicts.
+
+    :param items: The items from the API response
+    :return: The values of every item according to the application schema
+    Building a pydantic model per item and copying its values out again is
+    what made the ingest CPU bound. Items which only hold plain JSON values,
+    which is what the API sends, are validated by validate_plain_application
+    instead. Every other item goes through validate_application, so invalid
+    data fails with exactly the same error as before.
+    """
+    applications = []
+    for item in items:
+        try:
+            applications.append(validate_plain_application(item))
+        except NotPlainValue:
+            applications.append(validate_application(item).dict())
+    return applications
+
+
+def split_details(applications: List[dict]) -> List[dict]:
+    """Moves the detail columns of the applications into dicts of their own.
+
+    :param applications: The validated applications, which keep the columns
+    of the applications table
+    :return: The rows of the application details, in the same order
+    """
+    return [
+        {
+            "application_id": application["application_id"],
+            **{column: application.pop(column) for column in DETAIL_COLUMNS},
+        }
+        for application in applications
+    ]
+
+
+def add_epoch_days(applications: List[dict]):
+    """Adds the epoch days of their dates to the validated applications."""
+    for application in applications:
+        application["submitted_day"] = to_epoch_day(application["submitted_date"])
+        application["actioned_day"] = to_epoch_day(application["actioned_date"])
+
+
 def create_application(item: dict) -> Application:
     """Create an application object from the API response item.
 
     :param item: The item from the API response
     :return: The application object according to schema
     """
-    try:
-        application = ApplicationBase(**item)
-    except Exception as e:
-        error_logger.error(f"Invalid data: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Invalid data: {str(e)}")
+    application = validate_application(item)
     submitted_date = application.submitted_date
     actioned_date = application.actioned_date
     db_application = Application(
@@ -45,3 +160,156 @@ def create_application(item: dict) -> Application:
         actioned_date=actioned_date,
     )
     return db_application
+
+
+def save_applications(
+    db: Session,
+    items: List[dict],
+    chunk_size: int,
+    table: Table = Application.__table__,
+    details_table: Table = ApplicationDetails.__table__,
+) -> Iterator[int]:
+    """Save the API response items into the DB chunk by chunk.
+
+    :param db: The database session
+    :param items: The items from the API response
+    :param chunk_size: The number of applications to save per transaction
+    :param table: The table to insert into, e.g. a staging table
+    :param details_table: The table to insert the details into
+    :return: An iterator over the number of applications of each committed
+    chunk
+    Only the validated applications of the current chunk exist at a time,
+    they get bulk inserted, committed and dropped before the next chunk is
+    validated. This keeps the memory and the transactions small, no matter
+    how many items are passed in. The monthly rollup is not touched, it gets
+    rebuilt once the loaded table is swapped in. On PostgreSQL the chunks
+    are loaded with COPY instead of INSERT statements.
+    """
+    use_copy = get_dialect_name(db) == "postgresql"
+    for start in range(0, len(items), chunk_size):
+        applications = validate_applications(items[start : start + chunk_size])
+        details = split_details(applications)
+        add_epoch_days(applications)
+        if use_copy:
+            copy_rows(db, table, applications)
+            copy_rows(db, details_table, details)
+        else:
+            db.execute(insert(table), applications)
+            db.execute(insert(details_table), details)
+        db.commit()
+        yield len(applications)
+
+
+def upsert_applications(
+    db: Session, items: List[dict], chunk_size: int
+) -> Iterator[Counter]:
+    """Insert new and update changed applications chunk by chunk.
+
+    :param db: The database session
+    :param items: The items from the API response
+    :param chunk_size: The number of applications to save per transaction
+    :return: An iterator over the number of inserted, updated and unchanged
+    applications of each committed chunk
+    The applications of a chunk which are already stored are looked up by
+    their application_id in one query. New applications are inserted and
+    changed ones updated with one executemany each, without creating ORM
+    objects. Applications which did not change are left alone. The monthly
+    rollup gets the same changes in the same transaction. Applications
+    which are no longer returned by the API are not removed, a full reload
+    takes care of that. The details of changed applications are replaced.
+    """
+    table = Application.__table__
+    details_table = ApplicationDetails.__table__
+    columns = list(ApplicationBase.__fields__)
+    for start in range(0, len(items), chunk_size):
+        applications = validate_applications(items[start : start + chunk_size])
+        stored_applications = {
+            stored.application_id: stored._mapping
+            for stored in db.execute(
+                select(
+                    *[
+                        (details_table if column in DETAIL_COLUMNS else table).c[column]
+                        for column in columns
+                    ]
+                )
+                .outerjoin(
+                    details_table,
+                    details_table.c.application_id == table.c.application_id,
+                )
+                .where(
+                    table.c.application_id.in_(
+                        [application["application_id"] for application in applications]
+                    )
+                )
+            )
+        }
+        counts = Counter(inserted=0, updated=0, unchanged=0)
+        rollup_delta = RollupDelta()
+        inserts, updates = [], []
+        for application in applications:
+            stored = stored_applications.get(application["application_id"])
+            if stored is None:
+                inserts.append(application)
+                rollup_delta.add_application(application)
+                counts["inserted"] += 1
+            elif any(
+                (stored[column].name if column == "status" else stored[column])
+                != application[column]
+                for column in columns
+            ):
+                updates.append(
+                    dict(application, stored_application_id=stored["application_id"])
+                )
+                rollup_delta.add_application(stored, sign=-1)
+                rollup_delta.add_application(application)
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+        if inserts:
+            details = split_details(inserts)
+            add_epoch_days(inserts)
+            db.execute(insert(table), inserts)
+            db.execute(insert(details_table), details)
+        if updates:
+            details = split_details(updates)
+            add_epoch_days(updates)
+            db.execute(
+                update(table).where(
+                    table.c.application_id == bindparam("stored_application_id")
+                ),
+                updates,
+            )
+            db.execute(
+                delete(details_table).where(
+                    details_table.c.application_id.in_(
+                        [application["application_id"] for application in details]
+                    )
+                )
+            )
+            db.execute(insert(details_table), details)
+        apply_rollup_delta(db, rollup_delta)
+        db.commit()
+        yield counts
+
+
+def update_sync_state(db: Session, data_changed: bool) -> SyncState:
+    """Records a load in the sync state.
+
+    :param db: The database session
+    :param data_changed: Whether the load wrote anything into the DB
+    :return: The updated sync state
+    The generation only gets bumped if the data changed, so everything
+    derived from the data of a generation stays valid until the next change.
+    """
+    sync_state = db.get(SyncState, 1) or SyncState(id=1, generation=0)
+    sync_state.last_synced_at = datetime.now()
+    if data_changed:
+        sync_state.generation += 1
+    db.add(sync_state)
+    db.commit()
+    return sync_state
+
+
+def get_data_generation(db: Session) -> int:
+    """Returns the generation of the data, which every changing load bumps."""
+    return db.query(SyncState.generation).filter(SyncState.id == 1).scalar() or 0
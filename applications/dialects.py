@@ -0,0 +1,118 @@
+"""SQL which is written differently for SQLite and PostgreSQL.
+
+The report and the rollup only use the constructs of this module where the
+dialects differ, so every query runs on both databases.
+"""
+from datetime import date
+from enum import Enum
+from io import StringIO
+from typing import List
+
+from sqlalchemy import Integer, String, Table
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import FunctionElement
+
+
+class month_bucket(FunctionElement):
+    """The month of a date as YYYY-MM, like applications.rollup.month_of."""
+
+    type = String()
+    name = "month_bucket"
+    inherit_cache = True
+
+
+class epoch_days(FunctionElement):
+    """The days since 1970-01-01 of a date, like models.to_epoch_day."""
+
+    type = Integer()
+    name = "epoch_days"
+    inherit_cache = True
+
+
+@compiles(month_bucket)
+@compiles(epoch_days)
+def compile_unsupported(element, compiler, **kw):
+    raise CompileError(f"{element.name} is not supported on {compiler.dialect.name}")
+
+
+@compiles(month_bucket, "sqlite")
+def compile_sqlite_month_bucket(element, compiler, **kw):
+    return f"strftime('%Y-%m', {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(month_bucket, "postgresql")
+def compile_postgresql_month_bucket(element, compiler, **kw):
+    return (
+        f"to_char(date_trunc('month', {compiler.process(element.clauses, **kw)}),"
+        f" 'YYYY-MM')"
+    )
+
+
+@compiles(epoch_days, "sqlite")
+def compile_sqlite_epoch_days(element, compiler, **kw):
+    return (
+        f"CAST(julianday({compiler.process(element.clauses, **kw)}) - 2440587.5"
+        f" AS INTEGER)"
+    )
+
+
+@compiles(epoch_days, "postgresql")
+def compile_postgresql_epoch_days(element, compiler, **kw):
+    return f"({compiler.process(element.clauses, **kw)} - DATE '1970-01-01')"
+
+
+def get_dialect_name(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def to_copy_text(value) -> str:
+    """Formats a value for the text format of PostgreSQL's COPY."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.name
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(db: Session, table: Table, rows: List[dict]):
+    """Bulk loads rows into a PostgreSQL table with COPY FROM STDIN.
+
+    :param db: The database session
+    :param table: The table to load into
+    :param rows: The values of the rows, all with the same keys
+    COPY skips the planning and parameter binding of every single INSERT
+    and is the fastest way to get many rows into PostgreSQL. The rows are
+    sent within the transaction of the session.
+    """
+    if not rows:
+        return
+    preparer = db.get_bind().dialect.identifier_preparer
+    columns = [column.name for column in table.columns if column.name in rows[0]]
+    buffer = StringIO()
+    for row in rows:
+        buffer.write("\t".join(to_copy_text(row[column]) for column in columns))
+        buffer.write("\n")
+    statement = (
+        f"COPY {preparer.format_table(table)} "
+        f"({', '.join(preparer.quote(column) for column in columns)}) FROM STDIN"
+    )
+    cursor = db.connection().connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+        else:
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
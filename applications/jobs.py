@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+
+error_logger = logging.getLogger("uvicorn.error")
+
+
+class LoadJob:
+    """A load of the applications running in the background.
+
+    The load reports its progress through page_fetched and rows_saved, from
+    which the rate and the remaining time get estimated.
+    """
+
+    def __init__(self, mode: str, page_size: int):
+        self.job_id = uuid.uuid4().hex
+        self.mode = mode
+        self.page_size = page_size
+        self.status = "pending"
+        self.pages_fetched = 0
+        self.total_rows = None
+        self.rows_written = 0
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.finished = threading.Event()
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def page_fetched(self, total_rows: int):
+        with self._lock:
+            self.pages_fetched += 1
+            self.total_rows = total_rows
+
+    def rows_saved(self, num_of_rows: int):
+        with self._lock:
+            self.rows_written += num_of_rows
+
+    def as_dict(self) -> dict:
+        """Returns the state and progress of the job."""
+        with self._lock:
+            elapsed = 0.0
+            if self._started is not None:
+                elapsed = (self._finished or time.monotonic()) - self._started
+            rate = self.rows_written / elapsed if elapsed else 0.0
+            eta = None
+            if self.status == "running" and self.total_rows is not None and rate:
+                eta = max(self.total_rows - self.rows_written, 0) / rate
+            return {
+                "job_id": self.job_id,
+                "mode": self.mode,
+                "status": self.status,
+                "pages_fetched": self.pages_fetched,
+                "total_pages": math.ceil(self.total_rows / self.page_size)
+                if self.total_rows is not None
+                else None,
+                "rows_written": self.rows_written,
+                "total_rows": self.total_rows,
+                "rows_per_second": round(rate, 1),
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class LoadJobs:
+    """Runs load jobs one at a time, each in its own thread and event loop.
+
+    Starting a job while another one is running returns the running job
+    instead, so duplicate requests coalesce into one load. The jobs outlive
+    the request which started them and the last max_finished finished jobs
+    are kept to be looked up.
+    """
+
+    def __init__(self, max_finished: int = 20):
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._running: Optional[LoadJob] = None
+        self._lock = threading.Lock()
+
+    def start(
+        self,
+        mode: str,
+        page_size: int,
+        run: Callable[[LoadJob], Awaitable[dict]],
+    ) -> Tuple[LoadJob, bool]:
+        """Starts a job running run, unless one is running already.
+
+        :return: The job and whether it got started by this call
+        """
+        with self._lock:
+            if self._running is not None:
+                return self._running, False
+            job = LoadJob(mode, page_size)
+            self._jobs[job.job_id] = job
+            self._running = job
+            finished_jobs = [
+                job_id
+                for job_id, other_job in self._jobs.items()
+                if other_job.finished.is_set()
+            ]
+            for job_id in finished_jobs[
+                : max(len(finished_jobs) - self.max_finished, 0)
+            ]:
+                del self._jobs[job_id]
+        threading.Thread(
+            target=self._run, args=(job, run), name=f"load-{job.job_id}", daemon=True
+        ).start()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[LoadJob]:
+        return self._jobs.get(job_id)
+
+    @property
+    def running(self) -> Optional[LoadJob]:
+        return self._running
+
+    def _run(self, job: LoadJob, run: Callable[[LoadJob], Awaitable[dict]]):
+        job.status = "running"
+        job.started_at = datetime.now()
+        job._started = time.monotonic()
+        try:
+            job.result = asyncio.run(run(job))
+            job.status = "succeeded"
+        except HTTPException as e:
+            job.error = {"status_code": e.status_code, "detail": e.detail}
+            job.status = "failed"
+        except Exception as e:
+            error_logger.exception(f"Load job {job.job_id} failed")
+            job.error = {"status_code": 500, "detail": repr(e)}
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.now()
+            job._finished = time.monotonic()
+            with self._lock:
+                self._running = None
+            job.finished.set()
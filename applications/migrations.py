@@ -0,0 +1,195 @@
+"""Changes to the schema of existing databases.
+
+create_all only creates missing tables, so a change to a table which already
+exists, like a new index, ships as a migration. Every migration is applied
+once, in its own transaction, and recorded in the schema_migrations table.
+Migrations have to work on databases created before and after the change,
+as create_all already gives new databases the current schema.
+"""
+import argparse
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import MetaData, Table, insert, inspect, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from .dialects import epoch_days
+from .models import (
+    DETAIL_COLUMNS,
+    Application,
+    ApplicationDetails,
+    MonthlyRollup,
+    SchemaMigration,
+)
+from .staging import get_staging_table, replace_table
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def get_column_names(connection: Connection, table: Table) -> set:
+    return {column["name"] for column in inspect(connection).get_columns(table.name)}
+
+
+def create_indexes(connection: Connection, table: Table, *names: str):
+    """Creates the missing indexes of a table, or only the named ones.
+
+    Indexes on columns a later migration adds are left to that migration.
+    """
+    column_names = get_column_names(connection, table)
+    for index in table.indexes:
+        if (not names or index.name in names) and {
+            column.name for column in index.columns
+        } <= column_names:
+            index.create(connection, checkfirst=True)
+
+
+def add_report_indexes(connection: Connection):
+    """Replaces the status index with the covering indexes of the report."""
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_applications_status")
+    for table in (Application.__table__, MonthlyRollup.__table__):
+        create_indexes(connection, table)
+
+
+def add_long_waiting_index(connection: Connection):
+    """Adds the index the long waiting applications are paginated with."""
+    create_indexes(
+        connection, Application.__table__, "ix_applications_status_application_id"
+    )
+
+
+def move_application_details(connection: Connection):
+    """Moves the detail columns of the applications into application_details.
+
+    The applications table gets rebuilt without them, as dropping the
+    columns would leave its rows, and so its pages, as wide as before.
+    """
+    table = Application.__table__
+    details_table = ApplicationDetails.__table__
+    details_table.create(connection, checkfirst=True)
+    if not set(DETAIL_COLUMNS) <= get_column_names(connection, table):
+        return
+    previous_table = Table(table.name, MetaData(), autoload_with=connection)
+    detail_columns = ["application_id", *DETAIL_COLUMNS]
+    connection.execute(
+        insert(details_table).from_select(
+            detail_columns, select(*[previous_table.c[name] for name in detail_columns])
+        )
+    )
+    staging_table = get_staging_table(table)
+    staging_table.drop(connection, checkfirst=True)
+    staging_table.create(connection)
+    narrow_columns = [
+        column.name for column in table.columns if column.name in previous_table.c
+    ]
+    connection.execute(
+        insert(staging_table).from_select(
+            narrow_columns, select(*[previous_table.c[name] for name in narrow_columns])
+        )
+    )
+    replace_table(connection, table, staging_table)
+
+
+def add_epoch_days(connection: Connection):
+    """Mirrors the dates of the applications as epoch days and moves the
+    report indexes from the dates onto them."""
+    table = Application.__table__
+    column_names = get_column_names(connection, table)
+    for name in ("submitted_day", "actioned_day"):
+        if name not in column_names:
+            column_type = table.c[name].type.compile(connection.dialect)
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"
+            )
+    connection.execute(
+        update(table).values(
+            submitted_day=epoch_days(table.c.submitted_date),
+            actioned_day=epoch_days(table.c.actioned_date),
+        )
+    )
+    index_columns = {
+        index.name: [column.name for column in index.columns] for index in table.indexes
+    }
+    replaced_indexes = {
+        "ix_applications_status_submitted_date",
+        "ix_applications_status_actioned_date",
+    }
+    for index in inspect(connection).get_indexes(table.name):
+        name = index["name"]
+        if name in replaced_indexes or (
+            name in index_columns and index["column_names"] != index_columns[name]
+        ):
+            connection.exec_driver_sql(f"DROP INDEX {name}")
+    create_indexes(connection, table)
+
+
+MIGRATIONS = [
+    Migration(1, "Add covering indexes for the report queries", add_report_indexes),
+    Migration(
+        2,
+        "Add an index to page through the long waiting applications",
+        add_long_waiting_index,
+    ),
+    Migration(
+        3,
+        "Move the text and contact fields of the applications into their own table",
+        move_application_details,
+    ),
+    Migration(
+        4,
+        "Mirror the dates of the applications as epoch days for the report",
+        add_epoch_days,
+    ),
+]
+
+
+def get_applied_versions(engine: Engine) -> List[int]:
+    with engine.begin() as connection:
+        SchemaMigration.__table__.create(connection, checkfirst=True)
+        return list(connection.scalars(select(SchemaMigration.version)))
+
+
+def migrate(engine: Engine) -> List[int]:
+    """Applies the pending migrations in order.
+
+    :param engine: The engine of the database to migrate
+    :return: The versions of the migrations which got applied
+    """
+    applied_versions = set(get_applied_versions(engine))
+    newly_applied = []
+    for migration in MIGRATIONS:
+        if migration.version in applied_versions:
+            continue
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            connection.execute(
+                insert(SchemaMigration),
+                {
+                    "version": migration.version,
+                    "description": migration.description,
+                    "applied_at": datetime.now(),
+                },
+            )
+        newly_applied.append(migration.version)
+    return newly_applied
+
+
+if __name__ == "__main__":
+    from .database import engine
+
+    parser = argparse.ArgumentParser(
+        description="Apply the pending migrations to the database."
+    )
+    parser.add_argument("--list", action="store_true", help="only list the migrations")
+    args = parser.parse_args()
+    if args.list:
+        applied_versions = set(get_applied_versions(engine))
+        for migration in MIGRATIONS:
+            state = "applied" if migration.version in applied_versions else "pending"
+            print(f"{migration.version:>4} {state:<8} {migration.description}")
+    else:
+        for version in migrate(engine):
+            print(f"Applied migration {version}.")
@@ -1,9 +1,34 @@
+from datetime import date
 from enum import Enum
+from typing import Optional
 
-from sqlalchemy import Column, Integer, String, Date, Enum as EnumSA
+from sqlalchemy import Column, Integer, String, Date, DateTime, Enum as EnumSA, Index
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import relationship, validates
 
 from .database import Base
 
+DETAIL_COLUMNS = (
+    "lead_applicant_name",
+    "lead_applicant_email",
+    "lead_applicant_address",
+    "organisation_name",
+    "summary",
+)
+
+
+EPOCH = date(1970, 1, 1)
+
+
+def to_epoch_day(day: Optional[date]) -> Optional[int]:
+    """Returns the days since 1970-01-01 of a date, which is how the
+    applications store their dates a second time."""
+    return None if day is None else day.toordinal() - EPOCH.toordinal()
+
+
+def from_epoch_day(epoch_day: int) -> date:
+    return date.fromordinal(epoch_day + EPOCH.toordinal())
+
 
 class Status(Enum):
     submitted = 1
@@ -11,18 +36,163 @@ class Status(Enum):
     rejected = 3
 
 
+def detail_proxy(column: str):
+    """Makes a column of the details an attribute of the application, which
+    creates the details when it is set on an application without them."""
+    return association_proxy(
+        "details", column, creator=lambda value: ApplicationDetails(**{column: value})
+    )
+
+
 class Application(Base):
+    """An application as returned by the API.
+
+    Besides the single column indexes, which serve the date lookups of the
+    sync state, every report query has a composite index which covers all
+    the columns it reads, so none of them has to visit the table:
+    (status, submitted_day) counts the long waiting and the rejected
+    applications, (status, application_id) pages through the long waiting
+    ones in order, (status, actioned_day) serves the approved ones and the
+    processing time and (research_area, status) the rebuild of the monthly
+    rollup. As status is their first column, it needs no index of its own.
+    The dates are mirrored as submitted_day and actioned_day, the days since
+    1970-01-01, which the report queries index and read instead, so their
+    windows, cutoffs and durations are integer comparisons and differences.
+    They are set whenever a date is set. The rollup keeps grouping the dates
+    by their month, which SQL does faster on the text dates than on the days.
+    The free text and contact fields, which no report reads, live in
+    ApplicationDetails, so the rows of this table stay narrow and a scan
+    reads a fraction of the pages. They are still attributes of the
+    application, which load its details when first accessed.
+    """
+
     __tablename__ = "applications"
+    __table_args__ = (
+        Index(
+            "ix_applications_status_submitted_day",
+            "status",
+            "submitted_day",
+            "application_id",
+        ),
+        Index(
+            "ix_applications_status_application_id",
+            "status",
+            "application_id",
+            "submitted_day",
+        ),
+        Index(
+            "ix_applications_status_actioned_day",
+            "status",
+            "actioned_day",
+            "submitted_day",
+            "amount_awarded",
+        ),
+        Index(
+            "ix_applications_research_area_status",
+            "research_area",
+            "status",
+            "submitted_date",
+            "actioned_date",
+            "amount_awarded",
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     application_id = Column(String, unique=True, index=True)
+    amount_awarded = Column(Integer)
+    research_area = Column(String)
+    status = Column(EnumSA(Status, metadata=Base.metadata))
+    submitted_date = Column(Date, index=True)
+    actioned_date = Column(Date, index=True)
+    submitted_day = Column(Integer)
+    actioned_day = Column(Integer)
+    details = relationship(
+        "ApplicationDetails",
+        primaryjoin="Application.application_id"
+        " == foreign(ApplicationDetails.application_id)",
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
+    lead_applicant_name = detail_proxy("lead_applicant_name")
+    lead_applicant_email = detail_proxy("lead_applicant_email")
+    lead_applicant_address = detail_proxy("lead_applicant_address")
+    organisation_name = detail_proxy("organisation_name")
+    summary = detail_proxy("summary")
+
+    @validates("submitted_date", "actioned_date")
+    def set_epoch_day(self, key: str, day: Optional[date]) -> Optional[date]:
+        setattr(self, key.replace("_date", "_day"), to_epoch_day(day))
+        return day
+
+
+class ApplicationDetails(Base):
+    """The free text and contact fields of an application.
+
+    They are joined on the application_id, without a foreign key, so either
+    table can be replaced by a full load on its own.
+    """
+
+    __tablename__ = "application_details"
+
+    application_id = Column(String, primary_key=True)
     lead_applicant_name = Column(String)
     lead_applicant_email = Column(String)
     lead_applicant_address = Column(String)
     organisation_name = Column(String)
     summary = Column(String)
-    amount_awarded = Column(Integer)
-    research_area = Column(String)
-    status = Column(EnumSA(Status), index=True)
-    submitted_date = Column(Date, index=True)
-    actioned_date = Column(Date, index=True)
+
+
+class MonthlyRollup(Base):
+    """The applications counted per research area, month and status.
+
+    An application counts as submitted in the month of its submitted_date
+    and as actioned, together with its amount_awarded, in the month of its
+    actioned_date.
+    The covering indexes serve the report, which reads the rollup per month
+    and per research area.
+    """
+
+    __tablename__ = "monthly_rollup"
+    __table_args__ = (
+        Index(
+            "ix_monthly_rollup_month",
+            "month",
+            "status",
+            "submitted_count",
+            "actioned_count",
+            "actioned_amount",
+        ),
+        Index(
+            "ix_monthly_rollup_research_area",
+            "research_area",
+            "status",
+            "submitted_count",
+        ),
+    )
+
+    research_area = Column(String, primary_key=True)
+    month = Column(String(7), primary_key=True)
+    status = Column(EnumSA(Status, metadata=Base.metadata), primary_key=True)
+    submitted_count = Column(Integer, nullable=False, default=0)
+    actioned_count = Column(Integer, nullable=False, default=0)
+    actioned_amount = Column(Integer, nullable=False, default=0)
+
+
+class SyncState(Base):
+    """The time and data generation of the last load, kept in a single row."""
+
+    __tablename__ = "sync_state"
+
+    id = Column(Integer, primary_key=True)
+    last_synced_at = Column(DateTime)
+    generation = Column(Integer, nullable=False, default=0)
+
+
+class SchemaMigration(Base):
+    """A migration of applications.migrations which got applied."""
+
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String, nullable=False)
+    applied_at = Column(DateTime, nullable=False)
@@ -0,0 +1,204 @@
+import argparse
+import sys
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from .dialects import month_bucket
+from .models import Application, MonthlyRollup, Status
+
+RollupKey = Tuple[str, str, Status]
+
+
+def month_of(day: date) -> str:
+    """Returns the month of a date in the YYYY-MM format of the rollup."""
+    return day.strftime("%Y-%m")
+
+
+class RollupDelta:
+    """Collects how the rollup changes when applications are added or removed.
+
+    Every application adds one submitted to the rollup row of its submitted
+    month and, if it got actioned, one actioned and its amount_awarded to the
+    row of its actioned month.
+    """
+
+    def __init__(self):
+        self.changes: Dict[RollupKey, List[int]] = defaultdict(lambda: [0, 0, 0])
+
+    def add(
+        self,
+        research_area: str,
+        status,
+        submitted_date: Optional[date],
+        actioned_date: Optional[date],
+        amount_awarded: Optional[int],
+        sign: int = 1,
+    ):
+        """Adds an application, or removes it with a sign of -1."""
+        status = status if isinstance(status, Status) else Status[status]
+        if submitted_date is not None:
+            key = (research_area, month_of(submitted_date), status)
+            self.changes[key][0] += sign
+        if actioned_date is not None:
+            key = (research_area, month_of(actioned_date), status)
+            self.changes[key][1] += sign
+            self.changes[key][2] += sign * (amount_awarded or 0)
+
+    def add_application(self, application: Mapping, sign: int = 1):
+        """Adds a mapping with the fields of an application."""
+        self.add(
+            application["research_area"],
+            application["status"],
+            application["submitted_date"],
+            application["actioned_date"],
+            application["amount_awarded"],
+            sign,
+        )
+
+
+def apply_rollup_delta(db: Session, delta: RollupDelta):
+    """Adds the collected changes to the rollup rows, without committing.
+
+    Rows which end up counting nothing get deleted, so the rollup looks the
+    same as if it was rebuilt from scratch.
+    """
+    for key, (submitted, actioned, amount) in delta.changes.items():
+        if submitted == actioned == amount == 0:
+            continue
+        row = db.get(MonthlyRollup, key)
+        if row is None:
+            row = MonthlyRollup(
+                research_area=key[0],
+                month=key[1],
+                status=key[2],
+                submitted_count=0,
+                actioned_count=0,
+                actioned_amount=0,
+            )
+            db.add(row)
+        row.submitted_count += submitted
+        row.actioned_count += actioned
+        row.actioned_amount += amount
+        if row.submitted_count == 0 and row.actioned_count == 0:
+            db.delete(row)
+    db.flush()
+
+
+def compute_rollup(db: Session) -> Dict[RollupKey, List[int]]:
+    """Aggregates the rollup from a full scan of the applications.
+
+    One grouped query counts the applications per submitted month and one
+    counts and sums them per actioned month.
+    """
+    rollup = defaultdict(lambda: [0, 0, 0])
+    submitted_month = month_bucket(Application.submitted_date)
+    for research_area, month, status, submitted in (
+        db.query(
+            Application.research_area,
+            submitted_month,
+            Application.status,
+            func.count(Application.id),
+        )
+        .filter(Application.submitted_date.isnot(None))
+        .group_by(Application.research_area, Application.status, submitted_month)
+    ):
+        rollup[(research_area, month, status)][0] = submitted
+    actioned_month = month_bucket(Application.actioned_date)
+    for research_area, month, status, actioned, amount in (
+        db.query(
+            Application.research_area,
+            actioned_month,
+            Application.status,
+            func.count(Application.id),
+            func.coalesce(func.sum(Application.amount_awarded), 0),
+        )
+        .filter(Application.actioned_date.isnot(None))
+        .group_by(Application.research_area, Application.status, actioned_month)
+    ):
+        rollup[(research_area, month, status)][1:] = [actioned, amount]
+    return rollup
+
+
+def rebuild_rollup(db: Session):
+    """Replaces the rollup with a freshly computed one, without committing."""
+    db.query(MonthlyRollup).delete()
+    rows = [
+        {
+            "research_area": research_area,
+            "month": month,
+            "status": status,
+            "submitted_count": submitted,
+            "actioned_count": actioned,
+            "actioned_amount": amount,
+        }
+        for (research_area, month, status), (
+            submitted,
+            actioned,
+            amount,
+        ) in compute_rollup(db).items()
+    ]
+    if rows:
+        db.execute(insert(MonthlyRollup), rows)
+
+
+def backfill_rollup(db: Session):
+    """Builds the rollup of a DB which got loaded before there was one."""
+    if db.query(MonthlyRollup).first() is None and db.query(Application).first():
+        rebuild_rollup(db)
+        db.commit()
+
+
+def check_rollup(db: Session) -> List[str]:
+    """Compares the rollup with a full scan of the applications.
+
+    :param db: The database session
+    :return: A description of every rollup row which differs, so an empty
+    list means the rollup is consistent
+    """
+    stored = {
+        (row.research_area, row.month, row.status): [
+            row.submitted_count,
+            row.actioned_count,
+            row.actioned_amount,
+        ]
+        for row in db.query(MonthlyRollup)
+    }
+    computed = compute_rollup(db)
+    mismatches = []
+    for key in sorted(set(stored) | set(computed), key=str):
+        if stored.get(key) != computed.get(key):
+            research_area, month, status = key
+            mismatches.append(
+                f"{research_area} {month} {status.name}: rollup has "
+                f"{stored.get(key)}, applications have {computed.get(key)}"
+            )
+    return mismatches
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(
+        description="Verify the monthly rollup against a full scan of the "
+        "applications."
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="rebuild the rollup if it differs"
+    )
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        mismatches = check_rollup(db)
+        for mismatch in mismatches:
+            print(mismatch)
+        if mismatches and args.rebuild:
+            rebuild_rollup(db)
+            db.commit()
+            print("Rollup rebuilt.")
+        elif mismatches:
+            sys.exit(1)
+        else:
+            print("Rollup is consistent.")
@@ -0,0 +1,90 @@
+from typing import Tuple
+
+from sqlalchemy import Column, MetaData, Table
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .models import Application, ApplicationDetails
+
+STAGING_SUFFIX = "_staging"
+APPLICATION_TABLES = (Application.__table__, ApplicationDetails.__table__)
+
+
+def get_staging_table(table: Table = Application.__table__) -> Table:
+    """Returns the staging copy of a table.
+
+    It has the same columns, but no indexes or unique constraints, which
+    keeps the bulk inserts fast and avoids clashing with the index names of
+    the live table. It lives in its own MetaData, so that create_all never
+    creates it.
+    """
+    return Table(
+        table.name + STAGING_SUFFIX,
+        MetaData(),
+        *[
+            Column(
+                column.name,
+                column.type,
+                primary_key=column.primary_key,
+                nullable=column.nullable,
+            )
+            for column in table.columns
+        ],
+    )
+
+
+def create_staging_table(db: Session, table: Table = Application.__table__) -> Table:
+    """Creates an empty staging table, replacing leftovers of a failed load."""
+    staging_table = get_staging_table(table)
+    connection = db.connection()
+    staging_table.drop(connection, checkfirst=True)
+    staging_table.create(connection)
+    db.commit()
+    return staging_table
+
+
+def drop_staging_table(db: Session, table: Table = Application.__table__):
+    """Drops the staging table, e.g. after a load failed."""
+    db.rollback()
+    get_staging_table(table).drop(db.connection(), checkfirst=True)
+    db.commit()
+
+
+def swap_staging_table(db: Session, table: Table = Application.__table__):
+    """Replaces the live table with the loaded staging table.
+
+    :param db: The database session
+    :param table: The live table
+    The live table gets dropped, the staging table renamed to its name and
+    the indexes of the live table are created on it. This all happens in one
+    transaction, which is committed by the caller. Until then readers keep
+    seeing the previous data and if anything fails, e.g. a duplicate
+    application_id violating the unique index, the live table stays as is.
+    """
+    replace_table(db.connection(), table, get_staging_table(table))
+
+
+def replace_table(connection: Connection, table: Table, replacement: Table):
+    """Drops the table, renames the replacement to its name and creates the
+    indexes of the table on it."""
+    table.drop(connection)
+    connection.exec_driver_sql(f"ALTER TABLE {replacement.name} RENAME TO {table.name}")
+    for index in table.indexes:
+        index.create(connection)
+
+
+def create_staging_tables(db: Session) -> Tuple[Table, ...]:
+    """Creates the staging tables of the applications and their details."""
+    return tuple(create_staging_table(db, table) for table in APPLICATION_TABLES)
+
+
+def drop_staging_tables(db: Session):
+    for table in APPLICATION_TABLES:
+        drop_staging_table(db, table)
+
+
+def swap_staging_tables(db: Session):
+    """Replaces the applications and their details with the staging tables,
+    in the same transaction."""
+    for table in APPLICATION_TABLES:
+        swap_staging_table(db, table)
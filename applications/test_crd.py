@@ -1,8 +1,18 @@
 from datetime import datetime
 import pytest
-from .models import Application
+from .models import Application, ApplicationDetails, Status, SyncState
 
-from .crd import to_datetime_obj, create_application
+from report.test_build_report import session, engine
+from fastapi import HTTPException
+from .crd import (
+    to_datetime_obj,
+    create_application,
+    save_applications,
+    validate_application,
+    validate_applications,
+    update_sync_state,
+    upsert_applications,
+)
 
 
 @pytest.fixture
@@ -88,3 +98,79 @@ def test_check_eq_of_values_in_isolation_of_datetime(test_record):
 def test_correct_class_type_created(test_record):
     created_application = create_application(test_record)
     assert isinstance(created_application, Application)
+
+
+def test_save_applications_commits_per_chunk(session, test_record):
+    items = [dict(test_record, application_id=str(i)) for i in range(5)]
+    saved_chunks = list(save_applications(session, items, chunk_size=2))
+    assert saved_chunks == [2, 2, 1]
+    assert session.query(Application).count() == 5
+
+
+def test_upsert_applications_counts_changes(session, test_record):
+    items = [dict(test_record, application_id=str(i)) for i in range(3)]
+    assert list(upsert_applications(session, items, chunk_size=2)) == [
+        {"inserted": 2, "updated": 0, "unchanged": 0},
+        {"inserted": 1, "updated": 0, "unchanged": 0},
+    ]
+    items[1]["status"] = "rejected"
+    items[2]["amount_awarded"] = 10
+    items[2]["summary"] = "Revised"
+    items.append(dict(test_record, application_id="3"))
+    assert list(upsert_applications(session, items, chunk_size=10)) == [
+        {"inserted": 1, "updated": 2, "unchanged": 1}
+    ]
+    assert session.query(Application).count() == 4
+    assert session.query(ApplicationDetails).count() == 4
+    stored = session.query(Application).filter_by(application_id="1").one()
+    assert stored.status == Status.rejected
+    assert stored.summary == test_record["summary"]
+    stored = session.query(Application).filter_by(application_id="2").one()
+    assert (stored.amount_awarded, stored.summary) == (10, "Revised")
+    items[0]["organisation_name"] = "Other"
+    assert list(upsert_applications(session, items, chunk_size=10)) == [
+        {"inserted": 0, "updated": 1, "unchanged": 3}
+    ]
+
+
+def test_update_sync_state(session, test_record):
+    list(save_applications(session, [test_record], chunk_size=1))
+    sync_state = update_sync_state(session, data_changed=True)
+    assert sync_state.last_synced_at is not None
+    assert sync_state.generation == 1
+    assert update_sync_state(session, data_changed=False).generation == 1
+    assert session.query(SyncState).count() == 1
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {},
+        {"actioned_date": None, "summary": None},
+        {"amount_awarded": "5000", "submitted_date": "2022-1-1"},
+        {"submitted_date": datetime(2022, 1, 1).date(), "unknown_field": 1},
+        {"application_id": 55128, "status": "rejected"},
+    ],
+)
+def test_validate_applications_matches_pydantic(test_record, changes):
+    item = dict(test_record, **changes)
+    assert validate_applications([item]) == [validate_application(item).dict()]
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"submitted_date": "2022-13-01"},
+        {"submitted_date": None},
+        {"amount_awarded": "a lot"},
+        {"research_area": None},
+    ],
+)
+def test_validate_applications_raises_pydantic_errors(test_record, changes):
+    item = dict(test_record, **changes)
+    with pytest.raises(HTTPException) as expected_error:
+        validate_application(item)
+    with pytest.raises(HTTPException) as error:
+        validate_applications([test_record, item])
+    assert error.value.status_code == 400
+    assert error.value.detail == expected_error.value.detail
@@ -0,0 +1,37 @@
+from sqlalchemy import text
+
+from .database import create_sqlite_engine
+
+
+def test_create_sqlite_engine_sets_pragmas(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path}/applications.db")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == -32000
+    assert engine.pool.size() == 8
+    engine.dispose()
+
+
+def test_readers_are_not_blocked_by_a_writer(tmp_path):
+    engine = create_sqlite_engine(
+        f"sqlite:///{tmp_path}/applications.db",
+        pragmas={"journal_mode": "WAL", "busy_timeout": 0},
+    )
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE item (id INTEGER PRIMARY KEY)"))
+        connection.execute(text("INSERT INTO item VALUES (1)"))
+    with engine.connect() as writer, engine.connect() as reader:
+        writer.execute(text("INSERT INTO item VALUES (2)"))
+        assert reader.execute(text("SELECT count(*) FROM item")).scalar() == 1
+        writer.commit()
+        reader.rollback()
+        assert reader.execute(text("SELECT count(*) FROM item")).scalar() == 2
+    engine.dispose()
+
+
+def test_create_sqlite_engine_in_memory():
+    engine = create_sqlite_engine("sqlite://")
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT 1")).scalar() == 1
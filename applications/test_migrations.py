@@ -0,0 +1,167 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import Column, MetaData, String, Table, inspect
+from sqlalchemy.orm import Session
+
+from .database import create_sqlite_engine
+from .migrations import MIGRATIONS, migrate
+from .models import (
+    DETAIL_COLUMNS,
+    Application,
+    ApplicationDetails,
+    Base,
+    MonthlyRollup,
+    SchemaMigration,
+    Status,
+    to_epoch_day,
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path}/applications.db")
+    yield engine
+    engine.dispose()
+
+
+def get_index_names(engine, table_name):
+    return {index["name"] for index in inspect(engine).get_indexes(table_name)}
+
+
+def test_migrate_adds_report_indexes_to_existing_db(engine):
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for table in (Application.__table__, MonthlyRollup.__table__):
+            for index in table.indexes:
+                if (
+                    "status" in index.name
+                    or "month" in index.name
+                    or ("research_area" in index.name)
+                ):
+                    index.drop(connection)
+        connection.exec_driver_sql(
+            "CREATE INDEX ix_applications_status ON applications (status)"
+        )
+        SchemaMigration.__table__.drop(connection)
+
+    assert migrate(engine) == [migration.version for migration in MIGRATIONS]
+    application_indexes = get_index_names(engine, "applications")
+    assert "ix_applications_status" not in application_indexes
+    assert {
+        "ix_applications_status_submitted_day",
+        "ix_applications_status_application_id",
+        "ix_applications_status_actioned_day",
+        "ix_applications_research_area_status",
+    } <= application_indexes
+    assert {"ix_monthly_rollup_month", "ix_monthly_rollup_research_area"} <= (
+        get_index_names(engine, "monthly_rollup")
+    )
+    assert migrate(engine) == []
+
+
+def test_migrate_new_db(engine):
+    Base.metadata.create_all(engine)
+    assert migrate(engine) == [migration.version for migration in MIGRATIONS]
+    assert migrate(engine) == []
+
+
+def test_migrate_moves_application_details(engine):
+    wide_table = Table(
+        "applications",
+        MetaData(),
+        *[
+            Column(column.name, column.type, primary_key=column.primary_key)
+            for column in Application.__table__.columns
+            if column.name not in ("submitted_day", "actioned_day")
+        ],
+        *[Column(name, String) for name in DETAIL_COLUMNS],
+    )
+    wide_table.create(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            wide_table.insert(),
+            [
+                {
+                    "application_id": "1",
+                    "amount_awarded": 1000,
+                    "research_area": "mental_health",
+                    "status": "approved",
+                    "submitted_date": date(2023, 1, 1),
+                    "actioned_date": date(2023, 2, 1),
+                    **{name: f"{name} of 1" for name in DETAIL_COLUMNS},
+                },
+                {
+                    "application_id": "2",
+                    "amount_awarded": 0,
+                    "research_area": "cancer",
+                    "status": "submitted",
+                    "submitted_date": date(2023, 3, 1),
+                    "actioned_date": None,
+                    **{name: None for name in DETAIL_COLUMNS},
+                },
+            ],
+        )
+    Base.metadata.create_all(engine)
+
+    assert migrate(engine) == [migration.version for migration in MIGRATIONS]
+    assert {
+        column["name"] for column in inspect(engine).get_columns("applications")
+    } == ({column.name for column in Application.__table__.columns})
+    assert get_index_names(engine, "applications") == {
+        index.name for index in Application.__table__.indexes
+    }
+    with Session(engine) as session:
+        application = session.get(Application, 1)
+        assert application.status == Status.approved
+        assert application.actioned_date == date(2023, 2, 1)
+        assert application.actioned_day == to_epoch_day(date(2023, 2, 1))
+        for name in DETAIL_COLUMNS:
+            assert getattr(application, name) == f"{name} of 1"
+        assert session.get(Application, 2).summary is None
+        assert session.query(ApplicationDetails).count() == 2
+    assert migrate(engine) == []
+
+
+def get_index_columns(engine, table_name):
+    return {
+        index["name"]: index["column_names"]
+        for index in inspect(engine).get_indexes(table_name)
+    }
+
+
+def test_migrate_adds_epoch_days(engine):
+    Base.metadata.create_all(engine)
+    assert migrate(engine) == [migration.version for migration in MIGRATIONS]
+    expected_indexes = get_index_columns(engine, "applications")
+    with engine.begin() as connection:
+        for index in Application.__table__.indexes:
+            if any(column.name.endswith("_day") for column in index.columns):
+                index.drop(connection)
+        for column in ("submitted_day", "actioned_day"):
+            connection.exec_driver_sql(f"ALTER TABLE applications DROP COLUMN {column}")
+        connection.exec_driver_sql(
+            "CREATE INDEX ix_applications_status_submitted_date"
+            " ON applications (status, submitted_date, application_id)"
+        )
+        connection.exec_driver_sql(
+            "CREATE INDEX ix_applications_status_application_id"
+            " ON applications (status, application_id, submitted_date)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO applications (application_id, amount_awarded, research_area,"
+            " status, submitted_date, actioned_date) VALUES"
+            " ('1', 10, 'cancer', 'approved', '2023-01-01', '2023-03-01'),"
+            " ('2', 0, 'cancer', 'submitted', '1969-12-31', NULL)"
+        )
+        connection.execute(
+            SchemaMigration.__table__.delete().where(SchemaMigration.version == 4)
+        )
+
+    assert migrate(engine) == [4]
+    assert get_index_columns(engine, "applications") == expected_indexes
+    with Session(engine) as session:
+        assert session.get(Application, 1).submitted_day == 19358
+        assert session.get(Application, 1).actioned_day == 19417
+        assert session.get(Application, 2).submitted_day == -1
+        assert session.get(Application, 2).actioned_day is None
@@ -0,0 +1,64 @@
+from datetime import date
+
+from report.test_build_report import session, engine, test_applications
+from stub_api import create_items
+from .crd import upsert_applications
+from .models import Application, MonthlyRollup, Status
+from .rollup import check_rollup, rebuild_rollup
+
+
+def test_rebuild_rollup(session, test_applications):
+    assert check_rollup(session) == []
+    rollup = {
+        (row.research_area, row.month, row.status): (
+            row.submitted_count,
+            row.actioned_count,
+            row.actioned_amount,
+        )
+        for row in session.query(MonthlyRollup)
+    }
+    assert rollup[("climate_and_health", "2023-01", Status.rejected)] == (3, 1, 3000)
+    assert rollup[("mental_health", "2023-03", Status.approved)] == (0, 1, 1000)
+    assert rollup[("mental_health", "2023-01", Status.approved)] == (1, 0, 0)
+
+
+def test_upserts_keep_rollup_consistent(session):
+    items = create_items(5)
+    new_item = items.pop()
+    list(upsert_applications(session, items, chunk_size=3))
+    assert check_rollup(session) == []
+    items[0].update(status="approved", actioned_date="2023-02-01")
+    items[1].update(research_area="climate_and_health", amount_awarded=5)
+    items[2].update(submitted_date="2022-12-31", status="rejected")
+    items.append({**new_item, "status": "approved", "actioned_date": "2023-03-01"})
+    list(upsert_applications(session, items, chunk_size=2))
+    assert check_rollup(session) == []
+    items[0].update(status="submitted", actioned_date=None)
+    list(upsert_applications(session, items, chunk_size=10))
+    assert check_rollup(session) == []
+    assert (
+        session.get(MonthlyRollup, ("mental_health", "2023-02", Status.approved))
+        is None
+    )
+
+
+def test_check_rollup_finds_differences(session, test_applications):
+    session.add(
+        Application(
+            application_id="not-in-rollup",
+            amount_awarded=10,
+            research_area="mental_health",
+            status="approved",
+            submitted_date=date(2023, 1, 1),
+            actioned_date=date(2023, 2, 1),
+        )
+    )
+    session.flush()
+    assert check_rollup(session) == [
+        "mental_health 2023-01 approved: rollup has [1, 0, 0], "
+        "applications have [2, 0, 0]",
+        "mental_health 2023-02 approved: rollup has None, "
+        "applications have [0, 1, 10]",
+    ]
+    rebuild_rollup(session)
+    assert check_rollup(session) == []
@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from stub_api import create_items
+from .crd import save_applications
+from .database import create_sqlite_engine
+from .models import Application, ApplicationDetails, Base
+from .staging import create_staging_tables, drop_staging_tables, swap_staging_tables
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path}/applications.db")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def create_items_with_ids(*application_ids):
+    """Stub API items with the given ids, each with a summary naming its id."""
+    return [
+        {
+            **item,
+            "application_id": application_id,
+            "summary": f"Summary of {application_id}",
+        }
+        for item, application_id in zip(
+            create_items(len(application_ids)), application_ids
+        )
+    ]
+
+
+def test_swap_staging_table(engine, session):
+    list(save_applications(session, create_items_with_ids("1", "2"), chunk_size=10))
+    staging_tables = create_staging_tables(session)
+    list(
+        save_applications(
+            session, create_items_with_ids("3", "4", "5"), 2, *staging_tables
+        )
+    )
+    assert session.query(Application).count() == 2
+    assert session.query(ApplicationDetails).count() == 2
+
+    swap_staging_tables(session)
+    session.commit()
+    assert sorted(
+        (application.application_id, application.summary)
+        for application in session.query(Application)
+    ) == [("3", "Summary of 3"), ("4", "Summary of 4"), ("5", "Summary of 5")]
+    assert session.query(ApplicationDetails).count() == 3
+    inspector = inspect(engine)
+    assert "applications_staging" not in inspector.get_table_names()
+    assert "application_details_staging" not in inspector.get_table_names()
+    assert {index["name"] for index in inspector.get_indexes("applications")} == {
+        index.name for index in Application.__table__.indexes
+    }
+
+
+def test_failed_swap_keeps_live_table(engine, session):
+    list(save_applications(session, create_items_with_ids("1", "2"), chunk_size=10))
+    staging_tables = create_staging_tables(session)
+    with pytest.raises(IntegrityError):
+        list(
+            save_applications(
+                session, create_items_with_ids("3", "3"), 10, *staging_tables
+            )
+        )
+        swap_staging_tables(session)
+    drop_staging_tables(session)
+    assert sorted(
+        (application.application_id, application.summary)
+        for application in session.query(Application)
+    ) == [("1", "Summary of 1"), ("2", "Summary of 2")]
+    assert "applications_staging" not in inspect(engine).get_table_names()
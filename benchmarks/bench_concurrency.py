@@ -0,0 +1,141 @@
+"""Measure the /report/ throughput while a load writes into the DB.
+
+Run it from the project directory with e.g.:
+
+    python -m benchmarks.bench_concurrency --rows 50000 --load-rows 20000
+
+For every profile a SQLite file gets filled with --rows synthetic
+applications. Then an incremental load of --load-rows further applications
+runs against the stub API, while --clients clients keep requesting /report/
+with the report cache and the report snapshots disabled. The "default"
+profile is SQLite as it comes, with a rollback journal and SQLAlchemy's
+default pool, the "tuned" profile uses the pragmas and pool of
+create_sqlite_engine.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from sqlalchemy.orm import sessionmaker
+
+from applications.database import create_sqlite_engine
+from applications.models import Base
+from report.cache import ReportCache
+from report.snapshot import ReportSnapshots
+from stub_api import StubAPI, serve_stub_api
+from .run import populate
+from .synthetic import SyntheticApplications
+
+PROFILES = {
+    "default": {"pragmas": {}, "pool_size": 5, "max_overflow": 10},
+    "tuned": {},
+}
+
+
+async def request_reports(client: httpx.AsyncClient, load: asyncio.Future) -> list:
+    """Requests reports until the load is done, returns (status, seconds).
+
+    A report failing with an exception, e.g. as the database is locked, is
+    recorded with the status None.
+    """
+    results = []
+    while not load.done():
+        start = time.perf_counter()
+        try:
+            response = await client.get("/report/", params={"backend": "sql"})
+            status_code = response.status_code
+        except Exception:
+            status_code = None
+        results.append((status_code, time.perf_counter() - start))
+    return results
+
+
+async def measure_reports_during_load(main, num_of_clients: int) -> dict:
+    db = main.SessionLocal()
+    try:
+        async with httpx.AsyncClient(app=main.app, base_url="http://bench") as client:
+            start = time.perf_counter()
+            load = asyncio.ensure_future(main.run_load(db, main.LoadMode.incremental))
+            results = await asyncio.gather(
+                *(request_reports(client, load) for _ in range(num_of_clients))
+            )
+            load_result = await load
+            load_seconds = time.perf_counter() - start
+    finally:
+        db.close()
+    latencies = sorted(
+        seconds
+        for client_results in results
+        for status_code, seconds in client_results
+        if status_code == 200
+    )
+    errors = sum(
+        status_code != 200
+        for client_results in results
+        for status_code, seconds in client_results
+    )
+    return {
+        "load_seconds": load_seconds,
+        "load_rows_per_second": load_result["inserted"] / load_seconds,
+        "reports": len(latencies),
+        "errors": errors,
+        "reports_per_second": len(latencies) / load_seconds,
+        "p50": statistics.median(latencies) if latencies else None,
+        "p95": latencies[int(len(latencies) * 0.95)] if latencies else None,
+    }
+
+
+def run_profile(main, profile: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_sqlite_engine(
+            f"sqlite:///{os.path.join(directory, 'concurrency.db')}",
+            **PROFILES[profile],
+        )
+        Base.metadata.create_all(engine)
+        main.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        main.report_snapshots = ReportSnapshots(
+            os.path.join(directory, "snapshots"), max_snapshots=0
+        )
+        with main.SessionLocal() as db:
+            populate(db, SyntheticApplications(args.rows, seed=args.seed))
+        stub = StubAPI(SyntheticApplications(args.load_rows, seed=args.seed + 1))
+        with serve_stub_api(stub) as url:
+            main.API_URL = url
+            try:
+                return asyncio.run(measure_reports_during_load(main, args.clients))
+            finally:
+                engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[1:]),
+    )
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--load-rows", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES))
+    args = parser.parse_args()
+
+    os.environ.setdefault("API_TOKEN", "benchmark")
+    import main
+
+    main.report_cache = ReportCache(0, 0)
+    main.LOAD_CHUNK_SIZE = 1000
+    for profile in args.profiles:
+        result = run_profile(main, profile, args)
+        print(
+            f"{profile:<8} load {result['load_seconds']:>6.2f} s "
+            f"({result['load_rows_per_second']:>8.0f} rows/s), "
+            f"{result['reports']:>4} reports ({result['reports_per_second']:.1f}/s, "
+            f"p50 {(result['p50'] or 0) * 1000:.0f} ms, "
+            f"p95 {(result['p95'] or 0) * 1000:.0f} ms), "
+            f"{result['errors']} errors"
+        )
@@ -0,0 +1,75 @@
+"""Compare the rows/sec of the ways to ingest a page of API items.
+
+Run it from the project directory with:
+
+    python -m benchmarks.bench_ingest --rows 50000
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from applications.crd import (
+    add_epoch_days,
+    create_application,
+    save_applications,
+    split_details,
+    validate_application,
+)
+from applications.models import Application, ApplicationDetails, Base
+from stub_api import create_items
+
+
+def ingest_orm_objects(db, items):
+    """Pydantic model and ORM object per item, added with their details."""
+    db.add_all([create_application(item) for item in items])
+
+
+def ingest_pydantic_dicts(db, items):
+    """Pydantic model per item, its dict split and inserted with Core."""
+    applications = [validate_application(item).dict() for item in items]
+    details = split_details(applications)
+    add_epoch_days(applications)
+    db.execute(insert(Application.__table__), applications)
+    db.execute(insert(ApplicationDetails.__table__), details)
+
+
+def ingest_batch_validated(db, items):
+    """The whole batch saved by save_applications, as the loads do."""
+    for _ in save_applications(db, items, len(items)):
+        pass
+
+
+INGEST_PATHS = [ingest_orm_objects, ingest_pydantic_dicts, ingest_batch_validated]
+
+
+def measure(ingest, items, repeat: int) -> float:
+    """Returns the best rows/sec of ingesting the items into a fresh DB."""
+    best = float("inf")
+    for _ in range(repeat):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        with sessionmaker(bind=engine)() as db:
+            start = time.perf_counter()
+            ingest(db, items)
+            db.commit()
+            best = min(best, time.perf_counter() - start)
+        engine.dispose()
+    return len(items) / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    items = create_items(args.rows)
+    baseline = None
+    for ingest in INGEST_PATHS:
+        rows_per_sec = measure(ingest, items, args.repeat)
+        baseline = baseline or rows_per_sec
+        print(
+            f"{ingest.__name__:<24} {rows_per_sec:>10,.0f} rows/sec "
+            f"({rows_per_sec / baseline:.1f}x)"
+        )
@@ -0,0 +1,274 @@
+"""Time the report and the ingest on synthetic data and write the results.
+
+Run it from the project directory with e.g.:
+
+    python -m benchmarks.run --rows 10000 100000 --output before.json
+    python -m benchmarks.run --rows 10000 100000 --compare before.json
+
+Every build_report section, the rollup rebuild and the columnar backend are
+timed against a SQLite file filled with SyntheticApplications, as well as
+the encoding of the report's JSON per request with pydantic and with the
+validated and the trusted orjson path. For sizes up to --max-load-rows a
+full load is timed end to end against the stub API. The pages of every
+table and index are counted as well, as the report reads them. The results
+are written as JSON, so runs of different commits can be compared with
+--compare, which exits with 1 if anything got slower than --threshold times
+its previous median.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Callable, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from applications.crd import save_applications
+from applications.database import create_sqlite_engine
+from applications.models import Base
+from applications.rollup import rebuild_rollup
+from report.build_report import (
+    REPORT_SECTIONS,
+    Granularity,
+    build_report,
+    build_report_concurrently,
+    count_long_waiting_applications,
+    create_annual_stat,
+    get_application_status_per_research_area,
+    get_avg_time_between_submitted_and_actioned,
+    get_long_waiting_applications,
+    get_report_parameters,
+)
+from report.columnar import ColumnarApplications
+from report.schemas import Report
+from report.serialize import serialize_report
+from stub_api import StubAPI, serve_stub_api
+from .synthetic import SyntheticApplications
+
+POPULATE_CHUNK_SIZE = 10000
+
+
+def time_it(function: Callable, repeat: int) -> List[float]:
+    """Returns the seconds each of the repeated calls took."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def create_session(db_path: str):
+    engine = create_sqlite_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def populate(db, items: SyntheticApplications):
+    for start in range(0, len(items), POPULATE_CHUNK_SIZE):
+        chunk = items[start : start + POPULATE_CHUNK_SIZE]
+        list(save_applications(db, chunk, POPULATE_CHUNK_SIZE))
+    rebuild_rollup(db)
+    db.commit()
+
+
+def get_table_pages(db) -> Dict[str, int]:
+    """Returns the number of pages of every table and index of the DB."""
+    return dict(
+        db.execute(
+            text("SELECT name, count(*) FROM dbstat GROUP BY name ORDER BY name")
+        ).all()
+    )
+
+
+def scan_applications(db):
+    """Reads every row of the applications table, bypassing its indexes."""
+    db.execute(
+        text(
+            "SELECT count(*), sum(amount_awarded), max(actioned_date)"
+            " FROM applications NOT INDEXED"
+        )
+    ).one()
+
+
+def benchmark_report(db, repeat: int) -> dict:
+    """Times the report sections and backends on a populated DB."""
+    columnar_applications = ColumnarApplications.from_db(db)
+    session_factory = sessionmaker(bind=db.get_bind())
+    executor = ThreadPoolExecutor(len(REPORT_SECTIONS))
+    report = build_report(db)
+    weekly = get_report_parameters(
+        date.today(), months=36, granularity=Granularity.week
+    )
+    return {
+        "status_per_research_area": time_it(
+            lambda: get_application_status_per_research_area(db), repeat
+        ),
+        "annual_stat": time_it(lambda: create_annual_stat(db), repeat),
+        "annual_stat_36_months_weekly": time_it(
+            lambda: create_annual_stat(db, weekly), repeat
+        ),
+        "avg_processing_time": time_it(
+            lambda: get_avg_time_between_submitted_and_actioned(db), repeat
+        ),
+        "long_waiting_count": time_it(
+            lambda: count_long_waiting_applications(db), repeat
+        ),
+        "long_waiting_application_ids": time_it(
+            lambda: get_long_waiting_applications(db), repeat
+        ),
+        "scan_applications": time_it(lambda: scan_applications(db), repeat),
+        "build_report": time_it(lambda: build_report(db), repeat),
+        "build_report_concurrently": time_it(
+            lambda: build_report_concurrently(session_factory, executor), repeat
+        ),
+        "rebuild_rollup": time_it(lambda: (rebuild_rollup(db), db.commit()), repeat),
+        "columnar_load": time_it(lambda: ColumnarApplications.from_db(db), repeat),
+        "columnar_build_report": time_it(columnar_applications.build_report, repeat),
+        "columnar_annual_stat_36_months_weekly": time_it(
+            lambda: columnar_applications.create_annual_stat(weekly), repeat
+        ),
+        "encode_report_pydantic": time_it(
+            lambda: Report.parse_obj(report).json(separators=(",", ":")).encode(),
+            repeat,
+        ),
+        "encode_report_validated": time_it(
+            lambda: serialize_report(report, validate=True), repeat
+        ),
+        "encode_report": time_it(
+            lambda: serialize_report(report, validate=False), repeat
+        ),
+    }
+
+
+def benchmark_load(items: SyntheticApplications, directory: str) -> List[float]:
+    """Times a full load_applications against the stub API serving the items."""
+    os.environ.setdefault("API_TOKEN", "benchmark")
+    import main
+
+    with serve_stub_api(StubAPI(items)) as url:
+        main.API_URL = url
+        db = create_session(os.path.join(directory, "load.db"))
+        try:
+            return time_it(
+                lambda: asyncio.run(main.run_load(db, main.LoadMode.full)),
+                1,
+            )
+        finally:
+            db.close()
+
+
+def run(args) -> dict:
+    results, pages = [], {}
+    for num_of_rows in args.rows:
+        items = SyntheticApplications(num_of_rows, seed=args.seed)
+        with tempfile.TemporaryDirectory() as directory:
+            db = create_session(os.path.join(directory, "report.db"))
+            timings = {"populate": time_it(lambda: populate(db, items), 1)}
+            pages[num_of_rows] = get_table_pages(db)
+            timings.update(benchmark_report(db, args.repeat))
+            db.close()
+            if num_of_rows <= args.max_load_rows:
+                timings["load_applications"] = benchmark_load(items, directory)
+        for component, durations in timings.items():
+            results.append(
+                {
+                    "rows": num_of_rows,
+                    "component": component,
+                    "median": statistics.median(durations),
+                    "min": min(durations),
+                    "runs": durations,
+                }
+            )
+            print(
+                f"{num_of_rows:>10,} {component:<30} "
+                f"{statistics.median(durations) * 1000:>12.2f} ms"
+            )
+        for name, num_of_pages in pages[num_of_rows].items():
+            print(f"{num_of_rows:>10,} {name:<40} {num_of_pages:>10,} pages")
+    return {
+        "commit": get_commit(),
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "seed": args.seed,
+        "results": results,
+        "pages": pages,
+    }
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(previous: dict, current: dict, threshold: float) -> List[str]:
+    """Returns the components which got slower than the threshold allows."""
+    previous_medians = {
+        (result["rows"], result["component"]): result["median"]
+        for result in previous["results"]
+    }
+    regressions = []
+    for result in current["results"]:
+        key = (result["rows"], result["component"])
+        if key not in previous_medians or previous_medians[key] == 0:
+            continue
+        ratio = result["median"] / previous_medians[key]
+        print(f"{key[0]:>10,} {key[1]:<30} {ratio:>8.2f}x of {previous['commit']}")
+        if ratio > threshold:
+            regressions.append(f"{key[1]} with {key[0]} rows: {ratio:.2f}x slower")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[1:]),
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10000, 100000],
+        help="the numbers of applications, e.g. 10000 100000 1000000 10000000",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-load-rows", type=int, default=100000)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    current = run(args)
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results", f"{current['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as results_file:
+        json.dump(current, results_file, indent=2)
+    print(f"Results written to {output}")
+    if args.compare:
+        with open(args.compare) as previous_file:
+            regressions = compare(json.load(previous_file), current, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
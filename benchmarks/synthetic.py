@@ -0,0 +1,81 @@
+"""Deterministic synthetic applications in the format of the grants API."""
+import random
+import uuid
+from collections.abc import Sequence
+from datetime import date, timedelta
+from typing import Optional
+
+RESEARCH_AREAS = ["mental_health", "infectious_disease", "climate_and_health"]
+RESEARCH_AREA_WEIGHTS = [0.45, 0.35, 0.2]
+WORDS = (
+    "research study health clinical trial data climate mental infectious "
+    "disease community outcomes treatment prevention population analysis "
+    "impact network model evidence young people care public policy risk"
+).split()
+FIRST_NAMES = ["Alice", "Bob", "Charlie", "Dana", "Emre", "Fatima", "Greta", "Hugo"]
+LAST_NAMES = ["Smith", "Jones", "Okafor", "Schmidt", "Rossi", "Nakamura", "Silva"]
+
+
+class SyntheticApplications(Sequence):
+    """A read only list of num_of_items synthetic API items.
+
+    Every item is generated from the seed and its index only, so the items
+    can be sliced in any order, e.g. by the stub API, without holding all of
+    them in memory and a seed always gives the same data for the same today.
+    The distributions roughly follow the real data: most applications are
+    recent, approvals get actioned some weeks after their submission,
+    rejections have no actioned_date and only a few old applications are
+    still waiting to be actioned.
+    """
+
+    def __init__(self, num_of_items: int, seed: int = 0, today: Optional[date] = None):
+        self.num_of_items = num_of_items
+        self.seed = seed
+        self.today = today or date.today()
+
+    def __len__(self) -> int:
+        return self.num_of_items
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.create_item(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("synthetic application index out of range")
+        return self.create_item(index)
+
+    def create_item(self, index: int) -> dict:
+        """Creates the item at the index."""
+        rand = random.Random((self.seed << 40) + index)
+        age_in_days = int(1825 * rand.random() ** 1.5)
+        submitted_date = self.today - timedelta(days=age_in_days)
+        status_roll = rand.random()
+        if age_in_days < 60:
+            status = "submitted" if status_roll < 0.8 else "approved"
+        elif status_roll < 0.55:
+            status = "approved"
+        elif status_roll < 0.95:
+            status = "rejected"
+        else:
+            status = "submitted"
+        actioned_date = None
+        if status == "approved":
+            processing_days = 1 + int(rand.gammavariate(2, 20))
+            actioned_date = min(
+                submitted_date + timedelta(days=processing_days), self.today
+            ).isoformat()
+        first_name, last_name = rand.choice(FIRST_NAMES), rand.choice(LAST_NAMES)
+        return {
+            "application_id": str(uuid.UUID(int=rand.getrandbits(128), version=4)),
+            "lead_applicant_name": f"{first_name} {last_name}",
+            "lead_applicant_email": f"{first_name}.{last_name}@example.com".lower(),
+            "lead_applicant_address": f"{rand.randint(1, 300)} Main St",
+            "organisation_name": f"{rand.choice(WORDS).title()} Institute",
+            "summary": " ".join(rand.choices(WORDS, k=rand.randint(40, 90))),
+            "amount_awarded": int(round(rand.lognormvariate(10, 0.6), -2)),
+            "research_area": rand.choices(RESEARCH_AREAS, RESEARCH_AREA_WEIGHTS)[0],
+            "status": status,
+            "submitted_date": submitted_date.isoformat(),
+            "actioned_date": actioned_date,
+        }
@@ -0,0 +1,32 @@
+from collections import Counter
+from datetime import date
+
+from applications.crd import validate_applications
+from .synthetic import SyntheticApplications
+
+
+def test_synthetic_applications_are_deterministic():
+    items = SyntheticApplications(1000, seed=1, today=date(2023, 4, 1))
+    same_items = SyntheticApplications(1000, seed=1, today=date(2023, 4, 1))
+    other_items = SyntheticApplications(1000, seed=2, today=date(2023, 4, 1))
+    assert items[10:20] == same_items[10:20]
+    assert items[10:20] == [items[i] for i in range(10, 20)]
+    assert items[-1] == items[999]
+    assert items[:5] != other_items[:5]
+    assert len(items[990:2000]) == 10
+
+
+def test_synthetic_applications_are_valid_and_realistic():
+    items = SyntheticApplications(2000, today=date(2023, 4, 1))[:]
+    applications = validate_applications(items)
+    statuses = Counter(application["status"] for application in applications)
+    assert statuses["approved"] > statuses["rejected"] > statuses["submitted"] > 0
+    for application in applications:
+        assert application["submitted_date"] <= date(2023, 4, 1)
+        if application["status"] == "approved":
+            assert application["submitted_date"] <= application["actioned_date"]
+        else:
+            assert application["actioned_date"] is None
+    assert len({application["application_id"] for application in applications}) == (
+        2000
+    )
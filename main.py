@@ -1,18 +1,69 @@
 import os
+import asyncio
+import functools
+import json
 import logging
-from fastapi import FastAPI, Depends, HTTPException
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import aclosing
+from datetime import date
+from enum import Enum
+from typing import AsyncIterator, Dict, Optional, Tuple
+import httpx
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import Table
 from sqlalchemy.orm import Session
 from applications import models
-from applications.database import engine, SessionLocal, Base
-import requests
-from report.build_report import build_report
-from applications.crd import create_application
-from report.schemas import Report
+from applications.models import SyncState
+from applications.database import (
+    engine,
+    SessionLocal,
+    Base,
+    SQLALCHEMY_DATABASE_URL,
+)
+from applications.jobs import LoadJob, LoadJobs
+from applications.migrations import migrate
+from applications.rollup import backfill_rollup, rebuild_rollup
+from applications.staging import (
+    create_staging_tables,
+    drop_staging_tables,
+    swap_staging_tables,
+)
+from report.build_report import (
+    LONG_WAITING_DAYS,
+    LONG_WAITING_MAX_DAYS,
+    REPORT_MAX_MONTHS,
+    Granularity,
+    ReportParameters,
+    ReportWindow,
+    build_report_concurrently,
+    get_long_waiting_applications,
+    get_report_parameters,
+)
+from applications.crd import (
+    get_data_generation,
+    save_applications,
+    update_sync_state,
+    upsert_applications,
+)
+from metrics import Counter as MetricCounter, Gauge, Histogram, Registry
+from metrics import instrument_engine
+from report.cache import CachedReport, ReportCache, SingleFlight, SingleFlightFull
+from report.columnar import ColumnarStore
+from report.schemas import LongWaitingApplicationPage, Report
+from report.serialize import serialize_report
+from report.snapshot import ReportSnapshots, get_snapshot_directory
 
 info_logger = logging.getLogger("uvicorn.info")
 error_logger = logging.getLogger("uvicorn.error")
 
 Base.metadata.create_all(bind=engine)
+migrate(engine)
+with SessionLocal() as session:
+    backfill_rollup(session)
 
 app = FastAPI()
 
@@ -31,6 +82,17 @@ async def root():
     }
 
 
+async def run_in_executor(executor: Executor, function, *args):
+    """Runs blocking work, like DB queries, in the given thread pool.
+
+    The event loop keeps serving other requests meanwhile. As the pools are
+    bounded, work beyond their number of threads waits for a free thread.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(function, *args)
+    )
+
+
 def get_db():
     """Dependency to get the database session."""
     db = SessionLocal()
@@ -54,104 +116,823 @@ def check_for_api_token():
         )
 
 
-def get_data_from_api(skip: int, limit: int) -> dict:
+def get_api_client() -> httpx.AsyncClient:
+    """Provides the pooled keep-alive client to request the API with."""
+    return httpx.AsyncClient(
+        headers=get_api_header(API_TOKEN),
+        timeout=API_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=API_CONCURRENCY,
+            max_keepalive_connections=API_CONCURRENCY,
+        ),
+    )
+
+
+async def get_data_from_api(client: httpx.AsyncClient, skip: int, limit: int) -> dict:
     """This returns the data from the API.
 
+    :param client: The client to send the request with
     :param skip: The number of records to skip
     :param limit: The number of records to return
     :return: The json response from the API
     With the skip and limit parameters we can paginate through the API.
+    Connection errors and responses with a status code from
+    TRANSIENT_STATUS_CODES are retried up to API_MAX_RETRIES times, waiting
+    twice as long before every new attempt.
     """
-    headers = get_api_header(API_TOKEN)
     info_logger.info(f"Getting data from the API with skip={skip} and limit={limit}")
-    response = requests.get(
-        API_URL, headers=headers, params={"limit": limit, "skip": skip}
-    )
-    if response.status_code != 200:
-        error_logger.error(f"API returned status code {response.status_code}")
+    for attempt in range(API_MAX_RETRIES + 1):
+        backoff = API_RETRY_BACKOFF * 2**attempt
+        start = time.perf_counter()
+        try:
+            response = await client.get(API_URL, params={"limit": limit, "skip": skip})
+        except httpx.TransportError as e:
+            api_page_fetch_seconds.observe(time.perf_counter() - start, status="error")
+            if attempt == API_MAX_RETRIES:
+                error_logger.error(f"API could not be reached: {e!r}")
+                raise HTTPException(
+                    status_code=502,
+                    detail=f"There was a problem trying to access the API: {e!r}",
+                )
+            error_logger.warning(f"API could not be reached, retrying in {backoff}s")
+            await asyncio.sleep(backoff)
+            continue
+        api_page_fetch_seconds.observe(
+            time.perf_counter() - start, status=response.status_code
+        )
+        if response.status_code in TRANSIENT_STATUS_CODES and attempt < API_MAX_RETRIES:
+            error_logger.warning(
+                f"API returned status code {response.status_code}, "
+                f"retrying in {backoff}s"
+            )
+            await asyncio.sleep(backoff)
+            continue
+        if response.status_code != 200:
+            error_logger.error(f"API returned status code {response.status_code}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"There was a problem trying to access the API:"
+                f" {response.text}",
+            )
+        return response.json()
+
+
+async def get_pages_from_api(limit: int) -> AsyncIterator[dict]:
+    """Yields all pages of the API in the order they arrive.
+
+    :param limit: The number of records per page
+    :return: An async iterator over the json responses of the API
+    The first page tells us the number of available records. The skip
+    offsets of the remaining pages are then requested concurrently, but never
+    more than API_CONCURRENCY at a time. A new page only gets requested once
+    a finished one has been handed on, so the number of pages in memory stays
+    bounded, no matter how many records are available.
+    """
+    async with get_api_client() as client:
+        first_page = await get_data_from_api(client, 0, limit)
+        yield first_page
+        offsets = iter(range(limit, first_page["available_records"], limit))
+        pending = set()
+        try:
+            while True:
+                for skip in offsets:
+                    pending.add(
+                        asyncio.ensure_future(get_data_from_api(client, skip, limit))
+                    )
+                    if len(pending) >= API_CONCURRENCY:
+                        break
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+class LoadMode(str, Enum):
+    incremental = "incremental"
+    full = "full"
+
+
+@app.post("/load_applications/", status_code=202)
+async def load_applications(
+    response: Response,
+    mode: LoadMode = LoadMode.incremental,
+    wait: bool = False,
+):
+    """This endpoint starts loading the applications from the API into the DB.
+
+    :param response: The response to set the status code of
+    :param mode: Whether to sync the changes or to reload everything
+    :param wait: Whether to wait for the load to finish
+    :return: The load job with its id and progress, or, if waiting for it,
+    a message with the number of applications loaded into the DB and how
+    many of them got inserted, updated or were unchanged
+    The load runs in the background, so the request returns at once with
+    202 and the job, whose progress can be followed at
+    /load_applications/{job_id}. While a load is running, further requests
+    in the same mode join it instead of starting another one, requests in
+    the other mode get a 409 with the running job.
+    """
+    job = start_load_job(mode)
+    if job.mode != mode.value:
         raise HTTPException(
-            status_code=response.status_code,
-            detail=f"There was a problem trying to access the API:" f" {response.text}",
+            status_code=409,
+            detail={
+                "message": f"A {job.mode} load is running already.",
+                "job_id": job.job_id,
+                "job_url": f"/load_applications/{job.job_id}",
+            },
         )
-    return response.json()
+    if not wait:
+        response.headers["Location"] = f"/load_applications/{job.job_id}"
+        return job.as_dict()
+    await asyncio.get_running_loop().run_in_executor(None, job.finished.wait)
+    if job.error is not None:
+        raise HTTPException(**job.error)
+    response.status_code = 200
+    return job.result
+
+
+@app.get("/load_applications/{job_id}")
+async def get_load_job(job_id: str):
+    """This endpoint returns the state and progress of a load job.
+
+    :param job_id: The id of the job
+    :return: The job with the pages fetched, the rows written, the rate in
+    rows per second, the estimated seconds left and, once finished, its
+    result or error
+    """
+    job = load_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"There is no job {job_id}.")
+    return job.as_dict()
+
+
+def start_load_job(mode: LoadMode) -> LoadJob:
+    """Starts a load job in the given mode, or returns the running one."""
+    check_for_api_token()
+    job, started = load_jobs.start(
+        mode.value, API_PAGE_SIZE, functools.partial(load_in_background, mode)
+    )
+    if not started:
+        info_logger.info(f"Joining the running load job {job.job_id}")
+    return job
+
+
+async def load_in_background(mode: LoadMode, job: LoadJob) -> dict:
+    """Runs a load job with its own database session."""
+    db = SessionLocal()
+    try:
+        result = await run_load(db, mode, job)
+    finally:
+        db.close()
+    load_rows_per_second.set(job.as_dict()["rows_per_second"])
+    return result
 
 
-@app.post("/load_applications/")
-async def load_applications(db: Session = Depends(get_db)):
-    """This endpoint loads the applications from the API into the DB.
+async def run_load(db: Session, mode: LoadMode, job: Optional[LoadJob] = None):
+    """This loads the applications from the API into the DB.
 
     :param db: The database session
+    :param mode: Whether to sync the changes or to reload everything
+    :param job: The job to report the progress to
     :return: A message with the number of applications loaded into the DB
-    This function simulats a do while loop, which does not exist in Python.
-    It comes in handy here, to ensure that we get the total number of records
-    first so that we can ensure that all records are loaded into the DB. This
-    is done by checking if the skip parameter is greater than the total number
-    of records. If it is, we break out of the loop. If not, we continue to
-    load the data from the API into the DB and save bulk save it into the DB.
+    and how many of them got inserted, updated or were unchanged
+    The pages of the API are fetched concurrently by get_pages_from_api.
+    Every page gets saved and committed in chunks of LOAD_CHUNK_SIZE
+    applications as soon as it arrives. The DB work runs in the load thread
+    pool, which has a single thread, so the event loop keeps serving other
+    requests while the data is loaded and writes never compete.
+    An incremental load upserts the applications on their application_id and
+    only writes the ones which changed. It still fetches and compares every
+    application, as the API cannot filter for the changed ones. A full load inserts everything into a
+    staging table per table, which replace the live tables in one transaction
+    once all pages are saved. Until then reports are built from the previous data and
+    if the load fails the previous data stays in place.
     """
     check_for_api_token()
-    empty_table(db)
-    skip = 0
-    limit = 50000
-    applications = []
-    count = 0
+    staging_tables = None
+    if mode == LoadMode.full:
+        staging_tables = await run_in_executor(load_executor, create_staging_tables, db)
+    counts = Counter(inserted=0, updated=0, unchanged=0)
     try:
-        while True:
-            response_json = get_data_from_api(skip, limit)
-            total_number_of_records = response_json["available_records"]
-            if skip > total_number_of_records:
-                break
-            for item in response_json["items"]:
-                db_application = create_application(item)
-                applications.append(db_application)
-                count += 1
-                if count % 1000 == 0:
-                    percentage_complete = count / total_number_of_records * 100
-                    info_logger.info(
-                        f"Processing: {int(percentage_complete)}% loaded..."
-                    )
-            skip += limit
+        async with aclosing(get_pages_from_api(API_PAGE_SIZE)) as pages:
+            async for response_json in pages:
+                if job is not None:
+                    job.page_fetched(response_json["available_records"])
+                await run_in_executor(
+                    load_executor,
+                    save_page,
+                    db,
+                    response_json["items"],
+                    counts,
+                    response_json["available_records"],
+                    staging_tables,
+                    job,
+                )
+                del response_json
+        await run_in_executor(
+            load_executor,
+            finish_load,
+            db,
+            mode == LoadMode.full or counts["inserted"] + counts["updated"] > 0,
+            staging_tables,
+        )
     except KeyError:
         error_logger.error(f"The response did not return the expected JSON format.")
         raise HTTPException(
             status_code=400, detail="The response did not " "return the expected JSON."
         )
-    db.bulk_save_objects(applications)
-    db.commit()
-    info_logger.info(f"{count} Applications loaded into database")
-    return {"message": f"{count} applications successfully loaded into database."}
+    finally:
+        if staging_tables is not None:
+            await run_in_executor(load_executor, drop_staging_tables, db)
+    count = sum(counts.values())
+    info_logger.info(f"{count} Applications loaded into database: {dict(counts)}")
+    return {
+        "message": f"{count} applications successfully loaded into database.",
+        **counts,
+    }
+
+
+def save_page(
+    db: Session,
+    items: list,
+    counts: Counter,
+    total_number_of_records: int,
+    staging_tables: Optional[Tuple[Table, Table]] = None,
+    job: Optional[LoadJob] = None,
+):
+    """Saves the items of a page and logs the progress after every chunk.
+
+    :param db: The database session
+    :param items: The items of the page
+    :param counts: The number of inserted, updated and unchanged applications
+    so far, which gets updated with the ones of this page
+    :param total_number_of_records: The number of available records
+    :param staging_tables: The staging tables of the applications and their
+    details to insert the items into, if not given the items get upserted
+    into the live tables
+    :param job: The job to report the written rows to
+    """
+    if staging_tables is not None:
+        chunks = (
+            Counter(inserted=num_saved)
+            for num_saved in save_applications(
+                db, items, LOAD_CHUNK_SIZE, *staging_tables
+            )
+        )
+    else:
+        chunks = upsert_applications(db, items, LOAD_CHUNK_SIZE)
+    for chunk_counts in chunks:
+        counts.update(chunk_counts)
+        load_rows_written.inc(
+            sum(chunk_counts.values()),
+            mode="full" if staging_tables is not None else "incremental",
+        )
+        if job is not None:
+            job.rows_saved(sum(chunk_counts.values()))
+        count = sum(counts.values())
+        percentage_complete = count / total_number_of_records * 100
+        info_logger.info(
+            f"Processing: {int(percentage_complete)}% loaded "
+            f"({count}/{total_number_of_records})..."
+        )
+
+
+def finish_load(
+    db: Session,
+    data_changed: bool,
+    staging_tables: Optional[Tuple[Table, Table]] = None,
+) -> SyncState:
+    """Swaps in the staging tables, if any, and updates the sync state.
+
+    The swap, the rebuild of the monthly rollup and the sync state update
+    happen in the same transaction, so the new data, its rollup and its
+    generation become visible together. The report snapshots of the
+    previous data get removed afterwards and the latest snapshots stop
+    being served.
+    """
+    if staging_tables is not None:
+        swap_staging_tables(db)
+        rebuild_rollup(db)
+    sync_state = update_sync_state(db, data_changed)
+    if data_changed:
+        report_snapshots.clear()
+        latest_reports.clear()
+    return sync_state
+
+
+class SnapshotResponse(Response):
+    """A JSON response which sends the report's content as is, including a
+    view into a mapped snapshot, without copying it into bytes first."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content
+
+
+class ReportBackend(str, Enum):
+    sql = "sql"
+    columnar = "columnar"
+
+
+@app.on_event("startup")
+async def serve_latest_report():
+    """Serves the latest snapshot of the default report until it got refreshed.
+
+    The snapshots persist next to the DB, so after a restart the last built
+    report is available at once, even if it is from another day or data
+    generation, or if the DB is empty. It gets rebuilt in the background.
+    """
+    backend = ReportBackend(REPORT_BACKEND)
+    latest_report = report_snapshots.get_latest(backend.value)
+    if latest_report is not None:
+        latest_reports[backend] = latest_report[1]
+        threading.Thread(
+            target=refresh_latest_report,
+            args=(backend,),
+            name="report-refresh",
+            daemon=True,
+        ).start()
+
+
+def refresh_latest_report(backend: ReportBackend):
+    """Builds the default report, or loads the data first if the DB is
+    empty, and stops serving the latest snapshot once it is there.
+
+    The latest snapshot stops being served even if the refresh failed, so
+    the next request tries to build the report itself.
+    """
+    parameters = get_report_parameters(date.today())
+    try:
+        with SessionLocal() as db:
+            if is_empty(db):
+                job = start_load_job(LoadMode.full)
+                job.finished.wait()
+                if job.status != "succeeded":
+                    error_logger.error(f"Could not refresh the report: {job.error}")
+                    return
+            if get_cached_report(db, backend, parameters) is None:
+                build_and_cache_report(db, backend, parameters)
+    except Exception:
+        error_logger.exception("Could not refresh the report")
+    finally:
+        latest_reports.pop(backend, None)
 
 
 @app.get("/report/", response_model=Report)
-async def report(db: Session = Depends(get_db)):
+async def report(
+    db: Session = Depends(get_db),
+    backend: Optional[ReportBackend] = None,
+    months: Optional[int] = Query(None, ge=1, le=REPORT_MAX_MONTHS),
+    window: Optional[ReportWindow] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: Granularity = Granularity.month,
+    threshold_days: int = Query(LONG_WAITING_DAYS, ge=0, le=LONG_WAITING_MAX_DAYS),
+):
     """This endpoint builds the report.
 
     :param db: The database session
+    :param backend: Whether to build the report with SQL queries or from the
+    applications held in memory as NumPy arrays, defaults to REPORT_BACKEND
+    :param months: The number of months up to and including the current one
+    the annual statistic covers, 12 if no other window is given
+    :param window: The quarter or year to date instead
+    :param start: The first day of a custom window instead
+    :param end: The last day of the custom window, defaults to today
+    :param granularity: Whether to count the window per week, month or
+    quarter
+    :param threshold_days: The days after which a submitted application
+    counts as long waiting
     :return: The report
-    This function checks if the DB is empty. If it is, it calls the function
-    to load the data from the API into the DB and waits for it to finish. If
-    it is not empty, it builds the report, according to the given schema.
-    """
-    if db.query(models.Application).count() == 0:
-        error_logger.warning(
-            "Seems like we need to get the data from the API"
-            " before the report can be built. This might take"
-            " a couple of minutes..."
+    All DB work runs in the bounded report thread pool, so neither a slow
+    report nor many concurrent ones stall the event loop. The report only
+    changes with the data or the date, so a report which got built for the
+    current data generation today is served from the cache as already
+    serialized JSON, or from the snapshot any worker of the node built it
+    into. Right after the service started, the default report is served
+    from the latest snapshot until it got refreshed. Otherwise the report
+    gets built, but only once: concurrent requests for the same report join
+    the build in flight and get its result. At most REPORT_MAX_BUILDS
+    reports are built at a time and REPORT_MAX_QUEUED_BUILDS more wait for
+    their turn, further requests for other reports get a 503. The build
+    first checks if the DB is empty. If it is, this function starts a full
+    load of the data from the API, or joins the running one, and returns 503
+    with the id of the job at once, instead of blocking until the data is
+    there. The data is loaded through the staging table, so that concurrent
+    reports never see a partly loaded table. Otherwise the report gets
+    built, according to the given schema, and cached. Every distinct set of
+    parameters is cached on its own.
+    """
+    backend = backend or ReportBackend(REPORT_BACKEND)
+    try:
+        parameters = get_report_parameters(
+            date.today(), months, window, start, end, granularity, threshold_days
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+    cached_report = await run_in_executor(
+        report_executor, look_up_report, db, backend, parameters
+    )
+    if (
+        cached_report is None
+        and backend in latest_reports
+        and parameters == get_report_parameters(date.today())
+    ):
+        return SnapshotResponse(
+            content=latest_reports[backend], headers={"X-Report-Cache": "stale"}
+        )
+    if cached_report is None:
+        try:
+            build, started = report_builds.submit(
+                (date.today(), backend, parameters),
+                build_report_if_not_empty,
+                backend,
+                parameters,
+            )
+        except SingleFlightFull:
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Too many reports are being built."},
+                headers={"Retry-After": str(REPORT_BUILD_RETRY_AFTER)},
+            )
+        result = await asyncio.shield(asyncio.wrap_future(build))
+        if result is None:
+            error_logger.warning(
+                "Seems like we need to get the data from the API"
+                " before the report can be built. This might take"
+                " a couple of minutes..."
+            )
+            job = start_load_job(LoadMode.full)
+            return JSONResponse(
+                status_code=503,
+                content={
+                    "detail": "The applications are being loaded, "
+                    "the report will be available once the job finished.",
+                    "job_id": job.job_id,
+                    "job_url": f"/load_applications/{job.job_id}",
+                },
+                headers={"Retry-After": str(LOAD_RETRY_AFTER)},
+            )
+        cached_report, timings = result
+    else:
+        started, timings = False, None
+    if started and timings:
+        headers = {
+            "X-Report-Cache": "miss",
+            "Server-Timing": get_server_timing(timings),
+        }
+    elif timings:
+        headers = {"X-Report-Cache": "coalesced"}
+    else:
+        headers = {"X-Report-Cache": "hit"}
+    return SnapshotResponse(content=cached_report.content, headers=headers)
+
+
+class IdsFormat(str, Enum):
+    json = "json"
+    ndjson = "ndjson"
+
+
+@app.get(
+    "/report/long_waiting_application_ids",
+    response_model=LongWaitingApplicationPage,
+)
+async def long_waiting_application_ids(
+    db: Session = Depends(get_db),
+    after: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    format: IdsFormat = IdsFormat.json,
+    threshold_days: int = Query(LONG_WAITING_DAYS, ge=0, le=LONG_WAITING_MAX_DAYS),
+):
+    """This endpoint returns the ids of the long waiting applications.
+
+    :param db: The database session
+    :param after: The id to continue after, i.e. next_after of the previous
+    page
+    :param limit: The number of ids per page
+    :param format: Whether to return a page as JSON or to stream all ids
+    from after on as newline delimited JSON
+    :param threshold_days: The days after which a submitted application
+    counts as long waiting, like the report's
+    :return: A page of ids ordered by application_id, with the id to
+    request the next page after, or None on the last page
+    The report only carries the number of long waiting applications and the
+    first of their ids, as there might be a lot of them. Every page is a
+    single range read of the (status, application_id) index, so the response
+    size and memory stay bounded, no matter how large the backlog is. The
+    stream reads the ids in pages of limit as well.
+    """
+    if format == IdsFormat.ndjson:
+        return StreamingResponse(
+            stream_long_waiting_application_ids(after, limit, threshold_days),
+            media_type="application/x-ndjson",
+        )
+    application_ids = await run_in_executor(
+        report_executor,
+        get_long_waiting_applications,
+        db,
+        limit,
+        after,
+        threshold_days,
+    )
+    return {
+        "application_ids": application_ids,
+        "next_after": application_ids[-1] if len(application_ids) == limit else None,
+    }
+
+
+async def stream_long_waiting_application_ids(
+    after: Optional[str], page_size: int, threshold_days: int = LONG_WAITING_DAYS
+) -> AsyncIterator[bytes]:
+    """Yields the long waiting application ids page by page as NDJSON lines.
+
+    The stream outlives the request's session, so it uses a session of its
+    own.
+    """
+    db = SessionLocal()
+    try:
+        while True:
+            application_ids = await run_in_executor(
+                report_executor,
+                get_long_waiting_applications,
+                db,
+                page_size,
+                after,
+                threshold_days,
+            )
+            if application_ids:
+                yield "".join(
+                    f'{{"application_id":{json.dumps(application_id)}}}\n'
+                    for application_id in application_ids
+                ).encode()
+            if len(application_ids) < page_size:
+                break
+            after = application_ids[-1]
+    finally:
+        db.close()
+
+
+def get_cached_report(
+    db: Session, backend: ReportBackend, parameters: ReportParameters
+) -> Optional[CachedReport]:
+    """Returns the cached report of the current data generation and day.
+
+    If this worker has not cached it yet, another worker might have built it
+    already, so it looks for a snapshot of it too.
+    """
+    generation = get_data_generation(db)
+    key = (date.today(), backend, parameters)
+    cached_report = report_cache.get((generation, *key))
+    if cached_report is None:
+        content = report_snapshots.get(key, generation)
+        if content is not None:
+            cached_report = report_cache.put((generation, *key), None, content)
+    return cached_report
+
+
+def look_up_report(
+    db: Session, backend: ReportBackend, parameters: ReportParameters
+) -> Optional[CachedReport]:
+    """Returns the cached report and releases the session's connection.
+
+    The request does not need the DB anymore afterwards, so it does not
+    hold a connection while it waits for a build, which needs connections
+    of its own.
+    """
+    try:
+        return get_cached_report(db, backend, parameters)
+    finally:
+        db.close()
+
+
+def is_empty(db: Session) -> bool:
+    """Checks if there are no applications in the DB."""
+    return db.query(models.Application).first() is None
+
+
+def build_report_if_not_empty(
+    backend: ReportBackend, parameters: ReportParameters
+) -> Optional[Tuple[CachedReport, Dict[str, float]]]:
+    """Builds and caches the report, unless the DB is empty.
+
+    It runs as the single build of the report's requests, which may outlive
+    the request which started it, so it uses a session of its own.
+    :return: The result of build_and_cache_report or None if the DB is empty
+    """
+    with SessionLocal() as db:
+        if is_empty(db):
+            return None
+        return build_and_cache_report(db, backend, parameters)
+
+
+def build_and_cache_report(
+    db: Session, backend: ReportBackend, parameters: ReportParameters
+) -> Tuple[CachedReport, Dict[str, float]]:
+    """Builds the report with the backend, caches it and its JSON.
+
+    :return: The cached report and the seconds each part of it took, which
+    are empty if another worker built the report in the meantime
+    The SQL backend computes the report sections concurrently, each in its
+    own session, in the section thread pool. The report gets built while
+    holding the lock of its snapshot and written into the snapshot, so
+    whichever worker gets the lock first builds it and all others serve its
+    snapshot.
+    """
+    with report_snapshots.lock((date.today(), backend, parameters)):
+        cached_report = get_cached_report(db, backend, parameters)
+        if cached_report is not None:
+            return cached_report, {}
+        return build_report_snapshot(db, backend, parameters)
+
+
+def build_report_snapshot(
+    db: Session, backend: ReportBackend, parameters: ReportParameters
+) -> Tuple[CachedReport, Dict[str, float]]:
+    info_logger.info(f"Building report with the {backend.value} backend...")
+    start = time.perf_counter()
+    if backend == ReportBackend.columnar:
+        generation = get_data_generation(db)
+        report_dict = columnar_store.get(db, generation).build_report(
+            parameters=parameters
         )
-        await load_applications(db)
-    info_logger.info("Building report...")
-    return build_report(db)
+        timings = {"columnar": time.perf_counter() - start}
+    else:
+        report_dict, generation, timings = build_report_concurrently(
+            SessionLocal, section_executor, parameters=parameters
+        )
+    # The sections run concurrently, so their seconds add up to more than
+    # the build took.
+    report_build_seconds.observe(time.perf_counter() - start, backend=backend.value)
+    info_logger.info(f"Report built in {get_server_timing(timings)}")
+    if backend == ReportBackend.sql:
+        for section, seconds in timings.items():
+            report_section_seconds.observe(seconds, section=section)
+    key = (date.today(), backend, parameters)
+    content = serialize_report(report_dict)
+    report_snapshots.put(key, generation, content)
+    if parameters == get_report_parameters(date.today()):
+        report_snapshots.put_latest(backend.value, generation, content)
+    cached_report = report_cache.put((generation, *key), report_dict, content)
+    return cached_report, timings
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """This endpoint exposes the metrics in the Prometheus text format."""
+    return Response(
+        content=metrics_registry.render(), media_type=metrics_registry.content_type
+    )
 
 
-API_URL = "https://example-api.org/api"
+def get_server_timing(timings: Dict[str, float]) -> str:
+    """Formats the seconds per part as Server-Timing header in milliseconds."""
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+    )
+
+
+API_URL = os.environ.get("API_URL", "https://example-api.org/api")
 API_TOKEN = os.environ.get("API_TOKEN")
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", 10000))
+API_CONCURRENCY = int(os.environ.get("API_CONCURRENCY", 4))
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", 60))
+API_MAX_RETRIES = int(os.environ.get("API_MAX_RETRIES", 3))
+API_RETRY_BACKOFF = float(os.environ.get("API_RETRY_BACKOFF", 0.5))
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+REPORT_CACHE_SIZE = int(os.environ.get("REPORT_CACHE_SIZE", 16))
+REPORT_CACHE_TTL = float(os.environ.get("REPORT_CACHE_TTL", 3600))
+REPORT_BACKEND = os.environ.get("REPORT_BACKEND", "sql")
+
+REPORT_THREADS = int(os.environ.get("REPORT_THREADS", 4))
+
+report_cache = ReportCache(REPORT_CACHE_SIZE, REPORT_CACHE_TTL)
+REPORT_SNAPSHOT_DIR = os.environ.get(
+    "REPORT_SNAPSHOT_DIR", get_snapshot_directory(SQLALCHEMY_DATABASE_URL)
+)
+REPORT_SNAPSHOT_MAX_FILES = int(os.environ.get("REPORT_SNAPSHOT_MAX_FILES", 64))
+REPORT_SNAPSHOT_MAX_BYTES = int(
+    os.environ.get("REPORT_SNAPSHOT_MAX_BYTES", 64 * 2**20)
+)
+report_snapshots = ReportSnapshots(
+    REPORT_SNAPSHOT_DIR, REPORT_SNAPSHOT_MAX_FILES, REPORT_SNAPSHOT_MAX_BYTES
+)
+latest_reports: Dict[ReportBackend, memoryview] = {}
+columnar_store = ColumnarStore()
+report_executor = ThreadPoolExecutor(REPORT_THREADS, thread_name_prefix="report")
+REPORT_MAX_BUILDS = int(os.environ.get("REPORT_MAX_BUILDS", 2))
+REPORT_MAX_QUEUED_BUILDS = int(os.environ.get("REPORT_MAX_QUEUED_BUILDS", 8))
+REPORT_BUILD_RETRY_AFTER = int(os.environ.get("REPORT_BUILD_RETRY_AFTER", 1))
+report_builds = SingleFlight(
+    ThreadPoolExecutor(REPORT_MAX_BUILDS, thread_name_prefix="report-build"),
+    max_calls=REPORT_MAX_BUILDS + REPORT_MAX_QUEUED_BUILDS,
+)
+REPORT_SECTION_WORKERS = int(os.environ.get("REPORT_SECTION_WORKERS", 4))
+section_executor = ThreadPoolExecutor(
+    REPORT_SECTION_WORKERS, thread_name_prefix="report-section"
+)
+load_executor = ThreadPoolExecutor(1, thread_name_prefix="load")
+LOAD_CHUNK_SIZE = int(os.environ.get("LOAD_CHUNK_SIZE", 5000))
+LOAD_RETRY_AFTER = int(os.environ.get("LOAD_RETRY_AFTER", 30))
+load_jobs = LoadJobs()
+
+metrics_registry = Registry()
+report_build_seconds = metrics_registry.register(
+    Histogram("report_build_seconds", "Seconds to build a report.", ["backend"])
+)
+report_section_seconds = metrics_registry.register(
+    Histogram(
+        "report_section_seconds", "Seconds to compute a report section.", ["section"]
+    )
+)
+sql_statement_seconds = metrics_registry.register(
+    Histogram(
+        "sql_statement_seconds",
+        "Seconds to execute a SQL statement, by kind and first table.",
+        ["statement"],
+    )
+)
+api_page_fetch_seconds = metrics_registry.register(
+    Histogram(
+        "api_page_fetch_seconds",
+        "Seconds to request a page of the API, by status code.",
+        ["status"],
+    )
+)
+load_rows_written = metrics_registry.register(
+    MetricCounter(
+        "load_rows_written_total", "Applications written by the loads.", ["mode"]
+    )
+)
+load_rows_per_second = metrics_registry.register(
+    Gauge("load_rows_per_second", "Rows per second of the last successful load.")
+)
+metrics_registry.register(
+    MetricCounter(
+        "report_cache_hits_total",
+        "Reports served from the cache.",
+        callback=lambda: report_cache.hits,
+    )
+)
+metrics_registry.register(
+    MetricCounter(
+        "report_cache_misses_total",
+        "Reports not found in the cache.",
+        callback=lambda: report_cache.misses,
+    )
+)
+metrics_registry.register(
+    Gauge(
+        "report_cache_hit_ratio",
+        "Share of the report lookups served from the cache.",
+        callback=lambda: report_cache.stats()["hit_rate"],
+    )
+)
+metrics_registry.register(
+    Gauge(
+        "report_cache_entries",
+        "Reports in the cache.",
+        callback=lambda: report_cache.stats()["entries"],
+    )
+)
+metrics_registry.register(
+    Gauge(
+        "report_builds_in_flight",
+        "Reports being built or waiting to be built.",
+        callback=lambda: len(report_builds),
+    )
+)
+metrics_registry.register(
+    MetricCounter(
+        "report_builds_joined_total",
+        "Report requests which joined a build in flight.",
+        callback=lambda: report_builds.joined,
+    )
+)
+metrics_registry.register(
+    MetricCounter(
+        "report_builds_rejected_total",
+        "Report requests rejected as too many reports were being built.",
+        callback=lambda: report_builds.rejected,
+    )
+)
+instrument_engine(engine, sql_statement_seconds)
 
 
 def empty_table(db: Session):
     """Creates a clean slate for the database."""
     info_logger.info("Clearing database...")
     db.query(models.Application).delete()
-    db.commit()
+    db.query(models.ApplicationDetails).delete()
+    db.query(models.MonthlyRollup).delete()
+    update_sync_state(db, data_changed=True)
 
 
 def get_api_header(api_token: str) -> dict:
@@ -0,0 +1,266 @@
+"""Counters, gauges and histograms exposed in the Prometheus text format.
+
+Recording a value only takes a lock and a few additions, everything else,
+like formatting the samples, happens when the metrics get scraped.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+Labels = Tuple[str, ...]
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label_value(str(value))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric with a value per combination of its label values."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def get_label_values(self, labels: Dict[str, str]) -> Labels:
+        try:
+            if len(labels) == len(self.labelnames):
+                return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError:
+            pass
+        raise ValueError(
+            f"{self.name} has the labels {self.labelnames}, got {tuple(labels)}"
+        )
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """Yields the name suffix, the formatted labels and the value."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(
+            f"{self.name}{suffix}{labels} {format_value(value)}"
+            for suffix, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class ValueMetric(Metric):
+    """A metric holding a single value per label values.
+
+    With a callback the value is only computed when it gets scraped, e.g.
+    from the stats an object keeps anyway.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self._values: Dict[Labels, float] = {}
+
+    def get(self, **labels) -> Optional[float]:
+        if self.callback is not None:
+            return self.callback()
+        return self._values.get(self.get_label_values(labels))
+
+    def samples(self):
+        if self.callback is not None:
+            yield "", "", self.callback()
+            return
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", format_labels(self.labelnames, key), value
+
+
+class Counter(ValueMetric):
+    """A value which only goes up, like the number of rows written."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.get_label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(ValueMetric):
+    """A value which goes up and down."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self.get_label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Counts observations, like durations in seconds, into buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets))
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self.get_label_values(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def time(self, **labels) -> "Timer":
+        """Observes the seconds the with block takes."""
+        return Timer(self, labels)
+
+    def get_count(self, **labels) -> int:
+        return sum(self._counts.get(self.get_label_values(labels), ()))
+
+    def get_sum(self, **labels) -> float:
+        return self._sums.get(self.get_label_values(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            histograms = [
+                (key, list(counts), self._sums[key])
+                for key, counts in self._counts.items()
+            ]
+        labelnames = self.labelnames + ("le",)
+        for key, counts, total in histograms:
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", format_labels(
+                    labelnames, key + (format_value(upper_bound),)
+                ), cumulative
+            yield "_sum", format_labels(self.labelnames, key), total
+            yield "_count", format_labels(self.labelnames, key), cumulative
+
+
+class Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """The metrics to expose at one endpoint."""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"There is a metric {metric.name} already")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+@lru_cache(maxsize=512)
+def get_statement_label(statement: str) -> str:
+    """Returns the kind and the first table of a statement, e.g. SELECT
+    applications, which keeps the number of label values small."""
+    words = statement.split(None, 1)
+    kind = words[0].upper() if words else ""
+    match = re.search(
+        r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+\"?(\w+)", statement, re.IGNORECASE
+    )
+    return f"{kind} {match.group(1)}" if match else kind
+
+
+def instrument_engine(engine: Engine, histogram: Histogram):
+    """Observes the seconds of every statement the engine executes.
+
+    The histogram needs a statement label, see get_statement_label.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(connection, cursor, statement, parameters, context, executemany):
+        context.metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def observe_duration(
+        connection, cursor, statement, parameters, context, executemany
+    ):
+        histogram.observe(
+            time.perf_counter() - context.metrics_start,
+            statement=get_statement_label(statement),
+        )
@@ -1,21 +1,250 @@
 import calendar
-from typing import List
+import os
+import time
+from concurrent.futures import Executor
+from enum import Enum
+from functools import partial
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 from dateutil.relativedelta import relativedelta
-from sqlalchemy.orm import Session
-from applications.models import Application, Status
-from sqlalchemy import and_, func, or_
-from datetime import datetime, timedelta
-
-
-def build_report(db: Session) -> dict:
-    """Build it all together and create the final report."""
-    report = {
-        "status_per_research_area": get_application_status_per_research_area(db),
-        "annual_stat": create_annual_stat(db),
-        "avg_processing_time": get_avg_time_between_submitted_and_actioned(db),
-        "long_waiting_application_ids": get_long_waiting_applications(db),
+from sqlalchemy.orm import Query, Session
+from applications.crd import get_data_generation
+from applications.models import (
+    Application,
+    MonthlyRollup,
+    Status,
+    from_epoch_day,
+    to_epoch_day,
+)
+from applications.rollup import month_of
+from sqlalchemy import and_, case, func, literal, or_, select, union_all
+from datetime import date, datetime, timedelta
+
+LONG_WAITING_PREVIEW_SIZE = int(os.environ.get("LONG_WAITING_PREVIEW_SIZE", 100))
+LONG_WAITING_DAYS = int(os.environ.get("LONG_WAITING_DAYS", 60))
+LONG_WAITING_MAX_DAYS = 36600
+REPORT_MONTHS = 12
+REPORT_MAX_MONTHS = 120
+
+
+class Granularity(str, Enum):
+    month = "month"
+    week = "week"
+    quarter = "quarter"
+
+
+class ReportWindow(str, Enum):
+    quarter_to_date = "quarter_to_date"
+    year_to_date = "year_to_date"
+
+
+class ReportParameters(NamedTuple):
+    """The window and thresholds a report is built for.
+
+    The window is resolved to its first and last day, so the parameters can
+    be part of the report cache key.
+    """
+
+    start_date: date
+    end_date: date
+    granularity: Granularity = Granularity.month
+    threshold_days: int = LONG_WAITING_DAYS
+
+
+def get_report_parameters(
+    today: date,
+    months: Optional[int] = None,
+    window: Optional[ReportWindow] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    granularity: Granularity = Granularity.month,
+    threshold_days: int = LONG_WAITING_DAYS,
+) -> ReportParameters:
+    """Resolves the window of a report relative to today.
+
+    :param today: The day the report gets built on
+    :param months: The number of months up to and including the current
+    one, REPORT_MONTHS if no other window is given
+    :param window: A window up to today, like the quarter to date
+    :param start_date: The first day of a custom window
+    :param end_date: The last day of a custom window, defaults to today
+    :param granularity: The buckets to count the applications in
+    :param threshold_days: The days after which a submitted application
+    counts as long waiting
+    :return: The parameters of the report
+    :raises ValueError: If more than one kind of window is given, the
+    window ends before it starts, spans more than REPORT_MAX_MONTHS months or
+    reaches out of the range of dates
+    """
+    kinds_of_window = [
+        months is not None,
+        window is not None,
+        start_date is not None or end_date is not None,
+    ]
+    if sum(kinds_of_window) > 1:
+        raise ValueError("Give either months, a window or a start and end date.")
+    if start_date is not None or end_date is not None:
+        if start_date is None:
+            raise ValueError("A window with an end date needs a start date too.")
+        end_date = end_date or today
+    elif window == ReportWindow.quarter_to_date:
+        start_date = get_bucket_start(today, Granularity.quarter)
+        end_date = today
+    elif window == ReportWindow.year_to_date:
+        start_date = date(today.year, 1, 1)
+        end_date = today
+    else:
+        months = REPORT_MONTHS if months is None else months
+        start_date = today.replace(day=1) - relativedelta(months=months - 1)
+        end_date = today + relativedelta(day=31)
+    if start_date > end_date:
+        raise ValueError("The window ends before it starts.")
+    granularity = Granularity(granularity)
+    # Resolve the buckets and the cutoff once up front, so a window at the
+    # edge of the calendar fails here instead of in the build.
+    try:
+        is_too_long = start_date + relativedelta(months=REPORT_MAX_MONTHS) <= end_date
+        if not is_too_long:
+            get_bucket_starts(start_date, end_date, granularity)
+        today - timedelta(days=threshold_days)
+    except (OverflowError, ValueError) as error:
+        raise ValueError("The window is out of the range of dates.") from error
+    if is_too_long:
+        raise ValueError(f"The window spans more than {REPORT_MAX_MONTHS} months.")
+    return ReportParameters(start_date, end_date, granularity, threshold_days)
+
+
+def get_bucket_start(day: date, granularity: Granularity) -> date:
+    """Returns the first day of the week, month or quarter of a day."""
+    if granularity == Granularity.week:
+        return day - timedelta(days=day.weekday())
+    if granularity == Granularity.quarter:
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    return day.replace(day=1)
+
+
+def get_bucket_key(bucket_start: date, granularity: Granularity) -> tuple:
+    """Returns the year and the key of a bucket in the annual statistic.
+
+    Months are keyed like "04", quarters by their number and weeks by their
+    ISO week number within their ISO year.
+    """
+    if granularity == Granularity.week:
+        year, week, _ = bucket_start.isocalendar()
+        return year, week
+    if granularity == Granularity.quarter:
+        return bucket_start.year, (bucket_start.month - 1) // 3 + 1
+    return bucket_start.year, bucket_start.strftime("%m")
+
+
+def get_bucket_starts(
+    start_date: date, end_date: date, granularity: Granularity
+) -> List[date]:
+    """Returns the first day of every bucket of a window in ascending order.
+
+    The first bucket starts on or before the start date, only the days of
+    the window get counted into it though.
+    """
+    step = {
+        Granularity.week: relativedelta(weeks=1),
+        Granularity.month: relativedelta(months=1),
+        Granularity.quarter: relativedelta(months=3),
+    }[granularity]
+    bucket_start = get_bucket_start(start_date, granularity)
+    bucket_starts = []
+    while bucket_start <= end_date:
+        bucket_starts.append(bucket_start)
+        bucket_start += step
+    return bucket_starts
+
+
+def build_report(db: Session, parameters: Optional[ReportParameters] = None) -> dict:
+    """Build it all together and create the final report.
+
+    :param db: The database session
+    :param parameters: The window and thresholds of the report, the last
+    REPORT_MONTHS months per month and LONG_WAITING_DAYS if not given
+    """
+    return {
+        name: section(db) for name, section in get_report_sections(parameters).items()
     }
-    return report
+
+
+def get_report_sections(
+    parameters: Optional[ReportParameters] = None,
+) -> Dict[str, Callable[[Session], object]]:
+    """Returns the functions computing each section of the report by name."""
+    threshold_days = (
+        LONG_WAITING_DAYS if parameters is None else parameters.threshold_days
+    )
+    return {
+        "status_per_research_area": get_application_status_per_research_area,
+        "annual_stat": partial(create_annual_stat, parameters=parameters),
+        "avg_processing_time": get_avg_time_between_submitted_and_actioned,
+        "long_waiting_count": partial(
+            count_long_waiting_applications, threshold_days=threshold_days
+        ),
+        "long_waiting_application_ids": partial(
+            get_long_waiting_preview, threshold_days=threshold_days
+        ),
+    }
+
+
+def build_report_concurrently(
+    session_factory: Callable[[], Session],
+    executor: Executor,
+    max_attempts: int = 3,
+    parameters: Optional[ReportParameters] = None,
+) -> Tuple[dict, int, Dict[str, float]]:
+    """Build the report with every section computed concurrently.
+
+    :param session_factory: Creates the session of each section
+    :param executor: The thread pool to compute the sections in
+    :param max_attempts: How often to try before building the sections one
+    after another in a single session
+    :param parameters: The window and thresholds of the report
+    :return: The report, the data generation it got built on and the
+    seconds every section took
+    The sections are independent read only queries, so each runs in its own
+    session and the report takes as long as the slowest section instead of
+    all of them together. Every section reads the data generation in the
+    same transaction as its data. If a load committed in between and the
+    sections saw different generations, the report is built again, so it
+    never mixes the data of two loads.
+    """
+    sections = get_report_sections(parameters)
+    for _ in range(max_attempts):
+        futures = {
+            name: executor.submit(compute_section, session_factory, section)
+            for name, section in sections.items()
+        }
+        results = {name: future.result() for name, future in futures.items()}
+        generations = {generation for _, generation, _ in results.values()}
+        if len(generations) == 1:
+            return (
+                {name: result for name, (result, _, _) in results.items()},
+                generations.pop(),
+                {name: seconds for name, (_, _, seconds) in results.items()},
+            )
+    start = time.perf_counter()
+    with session_factory() as db:
+        generation = get_data_generation(db)
+        report = build_report(db, parameters)
+    return report, generation, {"build_report": time.perf_counter() - start}
+
+
+def compute_section(
+    session_factory: Callable[[], Session], section: Callable[[Session], object]
+) -> Tuple[object, int, float]:
+    """Computes a report section in a new session.
+
+    :return: The section, the data generation it was computed on and the
+    seconds it took
+    """
+    start = time.perf_counter()
+    with session_factory() as db:
+        generation = get_data_generation(db)
+        result = section(db)
+    return result, generation, time.perf_counter() - start
 
 
 def get_application_status_per_research_area(db: Session) -> dict:
@@ -23,10 +252,10 @@ def get_application_status_per_research_area(db: Session) -> dict:
 
     :param db: The database session
     :return: A dictionary with the research area as key and a dictionary
-    This filters out the application_ids which have been submitted, approved or
-    rejected by research_area. It uses the count function to count the total
-    number and groups them by research_area. It returns a list of sql alchemy
-    rows like ('infectious_disease', 0, 1, 0) and builds the dict from there.
+    This sums up the applications which have been submitted, approved or
+    rejected by research_area from the monthly rollup, so it does not need
+    to scan the applications. It returns a list of sql alchemy rows like
+    ('infectious_disease', 0, 1, 0) and builds the dict from there.
     The task it not 100% clear if it should return the total number of
     applications which got submitted or which have the status submitted.
     As the task is saying submitted and every approved and rejected application
@@ -35,18 +264,28 @@ def get_application_status_per_research_area(db: Session) -> dict:
     """
     results = (
         db.query(
-            Application.research_area,
-            func.count(Application.id)
-            .filter(Application.submitted_date.isnot(None))
-            .label("submitted"),
-            func.count(Application.id)
-            .filter(Application.status == Status.approved)
-            .label("approved"),
-            func.count(Application.id)
-            .filter(Application.status == Status.rejected)
-            .label("rejected"),
+            MonthlyRollup.research_area,
+            func.sum(MonthlyRollup.submitted_count).label("submitted"),
+            func.sum(
+                case(
+                    (
+                        MonthlyRollup.status == Status.approved,
+                        MonthlyRollup.submitted_count,
+                    ),
+                    else_=0,
+                )
+            ).label("approved"),
+            func.sum(
+                case(
+                    (
+                        MonthlyRollup.status == Status.rejected,
+                        MonthlyRollup.submitted_count,
+                    ),
+                    else_=0,
+                )
+            ).label("rejected"),
         )
-        .group_by(Application.research_area)
+        .group_by(MonthlyRollup.research_area)
         .all()
     )
 
@@ -60,43 +299,206 @@ def get_application_status_per_research_area(db: Session) -> dict:
     return research_areas
 
 
-def create_annual_stat(db: Session) -> dict:
+def create_annual_stat(
+    db: Session, parameters: Optional[ReportParameters] = None
+) -> dict:
     """
     Create the annual statistic with the last 12 months.
 
     :param db: The database session
+    :param parameters: The window and granularity of the statistic, the last
+    REPORT_MONTHS months per month if not given
     :return: A dictionary with the year as key and a dictionary with the months
     It iterates over the last 12 months and using i month for the key of the
     created annual statistic dictionary. This then gets enriched by the keys
-    submitted, approved and rejected which call functions to get the number
-    of the respective applications. It also adds an approved_funding key which
-    calls a function to calculate the approved funding of a given month. This
-    function could get optimised to use less SQL queries and filter on a
-    bigger queryset to improve performance. It also assumes  that rejections
-    have no actioned_date and therefore counts the rejection to the month
-    of the submission date. This seems a bit odd to me but the data in the
-    api seems to not have a single application which is rejected and has
-    an actioned_date. So I guess its save to assume that it got rejected
-    on submission which is why the rejection is counted for the month of
-    the submission. Also, worth noting that, submitted is not filtering on
+    submitted, approved and rejected with the number of the respective
+    applications, and approved_funding with the approved funding of the month.
+    All twelve months are looked up from a single call to get_monthly_stats
+    instead of querying every month and status on its own. It also assumes
+    that rejections have no actioned_date and therefore counts the rejection
+    to the month of the submission date. This seems a bit odd to me but the
+    data in the api seems to not have a single application which is rejected
+    and has an actioned_date. So I guess its save to assume that it got
+    rejected on submission which is why the rejection is counted for the month
+    of the submission. Also, worth noting that, submitted is not filtering on
     any status but assumes that every application, rejected or approved
     was submitted and therefore should be counted  for the month of
     submitting_date.
+    Other windows and granularities work the same way, newest bucket first,
+    see get_bucket_key for the keys of weeks and quarters. Windows of whole
+    months are summed up from the monthly rollup, all others from the daily
+    statistic of get_daily_stats, either way with a single grouped query.
     """
+    parameters = parameters or get_report_parameters(date.today())
+    start_date, end_date, granularity, _ = parameters
+    if (
+        granularity != Granularity.week
+        and start_date.day == 1
+        and end_date == end_date + relativedelta(day=31)
+    ):
+        stats = {
+            date(int(month[:4]), int(month[5:]), 1): month_stat
+            for month, month_stat in get_monthly_stats(db, start_date, end_date).items()
+        }
+    else:
+        stats = get_daily_stats(db, start_date, end_date)
+    bucket_stats = {}
+    for day, stat in stats.items():
+        bucket_stat = bucket_stats.setdefault(
+            get_bucket_start(day, granularity),
+            {"submitted": 0, "approved": 0, "rejected": 0, "approved_funding": 0},
+        )
+        for key, value in stat.items():
+            bucket_stat[key] += value or 0
     annual_stat = {}
-    for i in range(12):
-        month = datetime.today() - relativedelta(months=i)
-        year = month.year
-        month_num = month.strftime("%m")
-        annual_stat.setdefault(year, {})[month_num] = {
-            "submitted": get_num_of_appl_given_status_month(db, month),
-            "approved": get_num_of_appl_given_status_month(db, month, Status.approved),
-            "rejected": get_num_of_appl_given_status_month(db, month, Status.rejected),
-            "approved_funding": get_approved_funding_given_month(db, month),
+    for bucket_start in reversed(get_bucket_starts(start_date, end_date, granularity)):
+        bucket_stat = bucket_stats.get(bucket_start, {})
+        year, key = get_bucket_key(bucket_start, granularity)
+        annual_stat.setdefault(year, {})[key] = {
+            "submitted": bucket_stat.get("submitted", 0),
+            "approved": bucket_stat.get("approved", 0),
+            "rejected": bucket_stat.get("rejected", 0),
+            "approved_funding": bucket_stat["approved_funding"]
+            if bucket_stat.get("approved")
+            else None,
         }
     return annual_stat
 
 
+def get_daily_stats(db: Session, start_date: date, end_date: date) -> dict:
+    """Returns the statistic of every day between start and end date.
+
+    :param db: The database session
+    :param start_date: The first day
+    :param end_date: The last day
+    :return: A dictionary with the date as key and a dictionary with the keys
+    submitted, rejected, approved and approved_funding, counted the same way
+    as get_monthly_stats does per month.
+    The applications are grouped by their status and submitted_day and the
+    approved ones by their actioned_day in a single query, so any window
+    can be bucketed from it without a query per bucket. Both parts are range
+    reads of the (status, submitted_day) and (status, actioned_day)
+    indexes, which every application is in, as each one has a status. Days
+    without any application are left out.
+    """
+    start_day, end_day = to_epoch_day(start_date), to_epoch_day(end_date)
+    submitted = (
+        select(
+            Application.submitted_day,
+            Application.status,
+            func.count(),
+            literal(0),
+            literal(0),
+        )
+        .where(
+            and_(
+                Application.status.in_(list(Status)),
+                Application.submitted_day.between(start_day, end_day),
+            )
+        )
+        .group_by(Application.status, Application.submitted_day)
+    )
+    approved = (
+        select(
+            Application.actioned_day,
+            Application.status,
+            literal(0),
+            func.count(),
+            func.coalesce(func.sum(Application.amount_awarded), 0),
+        )
+        .where(
+            and_(
+                Application.status == Status.approved,
+                Application.actioned_day.between(start_day, end_day),
+            )
+        )
+        .group_by(Application.actioned_day)
+    )
+    daily_stats = {}
+    for day, status, submitted_count, approved_count, approved_funding in db.execute(
+        union_all(submitted, approved)
+    ):
+        stat = daily_stats.setdefault(
+            from_epoch_day(day),
+            {"submitted": 0, "rejected": 0, "approved": 0, "approved_funding": 0},
+        )
+        stat["submitted"] += submitted_count
+        if status == Status.rejected:
+            stat["rejected"] += submitted_count
+        stat["approved"] += approved_count
+        stat["approved_funding"] += approved_funding
+    return daily_stats
+
+
+def get_monthly_stats(db: Session, start_date: date, end_date: date) -> dict:
+    """Returns the statistic of every month between start and end date.
+
+    :param db: The database session
+    :param start_date: The first day of the first month
+    :param end_date: The last day of the last month
+    :return: A dictionary with the month as "YYYY-MM" key and a dictionary
+    with the keys submitted, rejected, approved and approved_funding.
+    Submitted and rejected applications are counted for the month of their
+    submitted_date and approved applications and their funding for the month
+    of their actioned_date, the same way get_num_of_appl_given_status_month
+    and get_approved_funding_given_month do it for a single month. The
+    numbers are summed up from the monthly rollup in one grouped query, no
+    matter how many months are asked for. Months without any application are
+    left out and the approved_funding of a month without approvals is None.
+    """
+    results = (
+        db.query(
+            MonthlyRollup.month,
+            func.sum(MonthlyRollup.submitted_count).label("submitted"),
+            func.sum(
+                case(
+                    (
+                        MonthlyRollup.status == Status.rejected,
+                        MonthlyRollup.submitted_count,
+                    ),
+                    else_=0,
+                )
+            ).label("rejected"),
+            func.sum(
+                case(
+                    (
+                        MonthlyRollup.status == Status.approved,
+                        MonthlyRollup.actioned_count,
+                    ),
+                    else_=0,
+                )
+            ).label("approved"),
+            func.sum(
+                case(
+                    (
+                        MonthlyRollup.status == Status.approved,
+                        MonthlyRollup.actioned_amount,
+                    ),
+                    else_=0,
+                )
+            ).label("approved_funding"),
+        )
+        .filter(
+            and_(
+                MonthlyRollup.month >= month_of(start_date),
+                MonthlyRollup.month <= month_of(end_date),
+            )
+        )
+        .group_by(MonthlyRollup.month)
+        .all()
+    )
+
+    monthly_stats = {}
+    for result in results:
+        monthly_stats[result.month] = {
+            "submitted": result.submitted,
+            "rejected": result.rejected,
+            "approved": result.approved,
+            "approved_funding": result.approved_funding if result.approved else None,
+        }
+    return monthly_stats
+
+
 def get_num_of_appl_given_status_month(
     db: Session, month_date: datetime, status: Status = None
 ) -> int:
@@ -107,11 +509,11 @@ def get_num_of_appl_given_status_month(
     :param status: The status of the applications
     :return: The number of applications in a given month with a given status
     """
-    start_date, end_date = get_month_date_range(month_date)
+    start_day, end_day = get_month_day_range(month_date)
     all_submissions = db.query(func.count(Application.id)).filter(
         and_(
-            Application.submitted_date >= start_date,
-            Application.submitted_date <= end_date,
+            Application.submitted_day >= start_day,
+            Application.submitted_day <= end_day,
         )
     )
     if status == Status.rejected:
@@ -124,8 +526,8 @@ def get_num_of_appl_given_status_month(
             .filter(
                 and_(
                     Application.status == status,
-                    Application.actioned_date >= start_date,
-                    Application.actioned_date <= end_date,
+                    Application.actioned_day >= start_day,
+                    Application.actioned_day <= end_day,
                 )
             )
             .scalar()
@@ -142,6 +544,12 @@ def get_month_date_range(month_date: datetime) -> tuple:
     return start_date.date(), end_date.date()
 
 
+def get_month_day_range(month_date: datetime) -> tuple:
+    """Returns the epoch days of the first and the last day of a month."""
+    start_date, end_date = get_month_date_range(month_date)
+    return to_epoch_day(start_date), to_epoch_day(end_date)
+
+
 def get_approved_funding_given_month(db: Session, month_date: datetime) -> float:
     """Returns the approved funding of a given month.
 
@@ -149,13 +557,13 @@ def get_approved_funding_given_month(db: Session, month_date: datetime) -> float
     :param month_date: The datetime of the month of the applications
     :return: The approved funding of a given month
     """
-    start_date, end_date = get_month_date_range(month_date)
+    start_day, end_day = get_month_day_range(month_date)
     return (
         db.query(func.sum(Application.amount_awarded))
         .filter(
             and_(
-                Application.actioned_date >= start_date,
-                Application.actioned_date <= end_date,
+                Application.actioned_day >= start_day,
+                Application.actioned_day <= end_day,
                 Application.status == Status.approved,
             )
         )
@@ -168,26 +576,17 @@ def get_avg_time_between_submitted_and_actioned(db: Session) -> int:
 
     :param db: The database session
     :return: The average time between submitted and actioned in days
-    Calculates the time between action date and
-    submitted date, to then use the avg function to get the average, which
-    basically divides through the filtered application count. Finally, the
-    minutes get converted into days and rounded appropriately to only return
-    full days.
+    Calculates the days between action date and submitted date as the
+    difference of their epoch days, to then use the avg function to get the
+    average, which basically divides through the filtered application count.
+    Finally, the average gets rounded appropriately to only return full days.
     """
-    avg_minutes_to_actioned = (
-        db.query(
-            func.avg(
-                (
-                    func.strftime("%s", Application.actioned_date)
-                    - func.strftime("%s", Application.submitted_date)
-                )
-                / 60
-            )
-        )
+    avg_days_to_actioned = (
+        db.query(func.avg(Application.actioned_day - Application.submitted_day))
         .filter(
             and_(
-                Application.submitted_date.isnot(None),
-                Application.actioned_date.isnot(None),
+                Application.submitted_day.isnot(None),
+                Application.actioned_day.isnot(None),
                 or_(
                     Application.status == Status.approved,
                     Application.status == Status.rejected,
@@ -196,34 +595,74 @@ def get_avg_time_between_submitted_and_actioned(db: Session) -> int:
         )
         .scalar()
     )
-    return round(avg_minutes_to_actioned / 1440)
+    return round(avg_days_to_actioned)
 
 
-def get_long_waiting_applications(db: Session) -> List[str]:
+def get_long_waiting_applications(
+    db: Session,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    threshold_days: int = LONG_WAITING_DAYS,
+) -> List[str]:
     """Get application ids which have not been actioned in more than 60 days.
 
     :param db: The database session
-    :return: A list of application ids which have not been actioned in 60 days
-    this function first defines a cutoff_date which is 60 days from the
-    current date in the past. It then filters through all applications which
-    have the status submitted and the submitted date is before the cutoff
-    date. To ensure that the ids are returned as a List of String the
-    function iterates over the row of returned ids and appends them in a
-    list which is getting returned.
-    """
-    cutoff_date = datetime.now() - timedelta(days=60)
-
-    long_waiting_applications = (
-        db.query(Application.application_id)
-        .filter(
-            and_(
-                Application.status == Status.submitted,
-                Application.submitted_date <= cutoff_date,
-            )
+    :param limit: The maximum number of ids to return, all if not given
+    :param after: Only return the ids after this one, to get the next page
+    :param threshold_days: The days after which an application counts as
+    long waiting, 60 by default
+    :return: A list of application ids which have not been actioned in 60
+    days, ordered by application_id
+    this function first defines a cutoff day, the epoch day 60 days before
+    today. It then filters through all applications which have the status
+    submitted and the submitted day is on or before the cutoff day. The ids
+    are paginated by their keyset, i.e. a page continues after the last id
+    of the previous one, which the (status, application_id) index serves in
+    order, no matter how far into the backlog the page is.
+    """
+    query = filter_long_waiting_applications(
+        db.query(Application.application_id), threshold_days
+    )
+    if after is not None:
+        query = query.filter(Application.application_id > after)
+    query = query.order_by(Application.application_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return [application_id for application_id, in query]
+
+
+def count_long_waiting_applications(
+    db: Session, threshold_days: int = LONG_WAITING_DAYS
+) -> int:
+    """Count the applications which have not been actioned in 60 days."""
+    return filter_long_waiting_applications(
+        db.query(func.count(Application.application_id)), threshold_days
+    ).scalar()
+
+
+def get_long_waiting_preview(
+    db: Session, threshold_days: int = LONG_WAITING_DAYS
+) -> List[str]:
+    """Get the first LONG_WAITING_PREVIEW_SIZE long waiting application ids.
+
+    The report only carries this preview and the count, so its size stays
+    bounded. All ids are served page by page on their own endpoint.
+    """
+    return get_long_waiting_applications(
+        db, limit=LONG_WAITING_PREVIEW_SIZE, threshold_days=threshold_days
+    )
+
+
+def filter_long_waiting_applications(
+    query: Query, threshold_days: int = LONG_WAITING_DAYS
+) -> Query:
+    cutoff_day = to_epoch_day(date.today()) - threshold_days
+    return query.filter(
+        and_(
+            Application.status == Status.submitted,
+            Application.submitted_day <= cutoff_day,
         )
-        .all()
     )
-    application_ids = []
-    for appl in long_waiting_applications:
-        application_ids.append(appl.application_id)
-    return application_ids
+
+
+REPORT_SECTIONS = get_report_sections()
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from typing import Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+
+class CachedReport(NamedTuple):
+    report: Optional[dict]
+    content: bytes
+    created_at: float
+
+
+class SingleFlightFull(Exception):
+    """Raised if a call would exceed the calls a SingleFlight admits."""
+
+
+class ReportCache:
+    """A bounded cache for built reports and their serialized JSON.
+
+    The cache key has to contain everything the report depends on, i.e. the
+    data generation and the date the report was built on. Entries expire
+    after ttl seconds and the least recently used entry gets evicted once
+    there are more than max_entries. Lookups and inserts are O(1).
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedReport]:
+        """Returns the cached report of the key, if there is a fresh one."""
+        with self._lock:
+            cached_report = self._entries.get(key)
+            if cached_report is not None and (
+                self.clock() - cached_report.created_at > self.ttl
+            ):
+                del self._entries[key]
+                cached_report = None
+            if cached_report is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached_report
+
+    def put(self, key: Hashable, report: dict, content: bytes) -> CachedReport:
+        """Caches the report and its JSON, evicting the oldest entries."""
+        cached_report = CachedReport(report, content, self.clock())
+        with self._lock:
+            self._entries[key] = cached_report
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached_report
+
+    def clear(self):
+        """Drops all cached reports."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counts and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+class SingleFlight:
+    """Runs a single call per key at a time and shares it with all callers.
+
+    While a call of a key is in flight, everyone asking for the key gets the
+    future of that call instead of starting another one. Once it is done, the
+    next caller starts a new call. At most max_calls keys are in flight,
+    running or queued in the executor, beyond that callers get rejected.
+    """
+
+    def __init__(self, executor: Executor, max_calls: Optional[int] = None):
+        self.executor = executor
+        self.max_calls = max_calls
+        self.started = 0
+        self.joined = 0
+        self.rejected = 0
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: Hashable, function: Callable, *args) -> Tuple[Future, bool]:
+        """Returns the future of the key's call, starting it if there is none.
+
+        :return: The future and whether this caller started the call
+        :raises SingleFlightFull: If max_calls other keys are in flight
+        """
+        with self._lock:
+            self._drop_done_calls()
+            future = self._calls.get(key)
+            if future is not None:
+                self.joined += 1
+                return future, False
+            if self.max_calls is not None and len(self._calls) >= self.max_calls:
+                self.rejected += 1
+                raise SingleFlightFull(f"{len(self._calls)} calls are in flight")
+            future = self.executor.submit(function, *args)
+            self._calls[key] = future
+            self.started += 1
+        future.add_done_callback(lambda _: self._finish(key, future))
+        return future, True
+
+    def _finish(self, key: Hashable, future: Future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def _drop_done_calls(self):
+        """Drops the calls which are done but whose callback did not run yet.
+
+        A future is done before its done callbacks run, so its callers may
+        already have its result while it is still in the calls.
+        """
+        for key in [key for key, future in self._calls.items() if future.done()]:
+            del self._calls[key]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._drop_done_calls()
+            return len(self._calls)
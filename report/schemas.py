@@ -29,5 +29,11 @@ class StatusPerResearchArea(BaseModel):
 class Report(BaseModel):
     annual_stat: AnnualStat
     avg_processing_time: float
+    long_waiting_count: int
     long_waiting_application_ids: List[str]
     status_per_research_area: StatusPerResearchArea
+
+
+class LongWaitingApplicationPage(BaseModel):
+    application_ids: List[str]
+    next_after: Optional[str]
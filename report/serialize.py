@@ -0,0 +1,80 @@
+"""Serializes the report to the JSON of the Report schema with orjson.
+
+Validating the report with pydantic and dumping it with json takes longer
+than building a cached report takes to look up, so the report dicts of
+build_report and the columnar backend are converted directly. The output
+is the same JSON Report.parse_obj(report).json() produces: the fields in
+the order of the schema, the years and months as keys without leading
+zeros, floats for avg_processing_time and approved_funding and only the
+research areas of StatusPerResearchArea.
+"""
+import os
+
+import orjson
+
+from .schemas import MonthStatWithoutFunding, Report, StatusPerResearchArea
+
+REPORT_VALIDATE = os.environ.get("REPORT_VALIDATE", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+RESEARCH_AREAS = tuple(StatusPerResearchArea.__fields__)
+STATUS_FIELDS = tuple(MonthStatWithoutFunding.__fields__)
+
+
+def to_optional_float(value):
+    return None if value is None else float(value)
+
+
+def to_month_stat(month_stat: dict) -> dict:
+    return {
+        "submitted": int(month_stat["submitted"]),
+        "approved": int(month_stat["approved"]),
+        "rejected": int(month_stat["rejected"]),
+        "approved_funding": to_optional_float(month_stat.get("approved_funding")),
+    }
+
+
+def to_report_output(report: dict) -> dict:
+    """Converts a report dict of a trusted builder to the Report's JSON types.
+
+    :param report: The report as built by build_report or the columnar backend
+    :return: A dict with only str keys, which orjson serializes as is
+    """
+    return {
+        "annual_stat": {
+            str(int(year)): {
+                str(int(month)): to_month_stat(month_stat)
+                for month, month_stat in year_stat.items()
+            }
+            for year, year_stat in report["annual_stat"].items()
+        },
+        "avg_processing_time": float(report["avg_processing_time"]),
+        "long_waiting_count": int(report["long_waiting_count"]),
+        "long_waiting_application_ids": [
+            str(application_id)
+            for application_id in report["long_waiting_application_ids"]
+        ],
+        "status_per_research_area": {
+            research_area: {
+                field: int(report["status_per_research_area"][research_area][field])
+                for field in STATUS_FIELDS
+            }
+            for research_area in RESEARCH_AREAS
+        },
+    }
+
+
+def serialize_report(report: dict, validate: bool = REPORT_VALIDATE) -> bytes:
+    """Returns the JSON of the report.
+
+    :param report: The report dict
+    :param validate: Whether to validate the report with the Report schema
+    first, which raises a ValidationError if it doesn't conform. The report
+    builders are trusted, so it is skipped unless REPORT_VALIDATE is set.
+    """
+    if validate:
+        report = Report.parse_obj(report).dict()
+    return orjson.dumps(to_report_output(report))
@@ -0,0 +1,183 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Hashable, Iterator, Optional, Tuple
+
+from sqlalchemy.engine import make_url
+
+HEADER = struct.Struct("<8sqd")
+MAGIC = b"RPTSNAP1"
+LOCK_STRIPES = 64
+
+
+def get_snapshot_directory(database_url: str) -> str:
+    """Returns the directory for the report snapshots of a DB.
+
+    The snapshots of a SQLite file live next to it, like its -wal file, the
+    ones of any other DB in the temp directory, named by its URL.
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    ):
+        return os.path.abspath(url.database) + "-snapshots"
+    name = hashlib.sha1(url.render_as_string(hide_password=False).encode())
+    return os.path.join(tempfile.gettempdir(), f"report-snapshots-{name.hexdigest()}")
+
+
+class ReportSnapshots:
+    """Serialized reports shared by all worker processes of a node as files.
+
+    Every report key has a file in the directory, which starts with a
+    header holding the data generation the report got built on, followed by
+    its JSON. A new snapshot is written to a temporary file and renamed over
+    the previous one, so readers either see the old or the new snapshot,
+    never a partly written one. Readers map the file into memory and serve
+    the JSON from the mapping, so the workers share the page cache's copy
+    instead of each holding its own. The lock of a key makes sure that only
+    one worker builds the report, while the others wait for its snapshot.
+    The directory persists, so after a restart the snapshots of the current
+    day and data generation are served right away and the latest snapshots
+    until the report got rebuilt. Every key gets a file, so the least
+    recently used snapshots are removed once there are more than
+    max_snapshots or they take more than max_bytes. Serving a snapshot
+    touches its file, so the modification times order them by use.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_snapshots: int = 64,
+        max_bytes: int = 64 * 2**20,
+    ):
+        self.directory = directory
+        self.max_snapshots = max_snapshots
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, key: Hashable) -> str:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.snapshot")
+
+    def get_latest_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.latest")
+
+    def get(self, key: Hashable, generation: int) -> Optional[memoryview]:
+        """Returns the JSON of the key's snapshot of the generation, if any.
+
+        :param key: The report key, which must have the same repr in every
+        worker
+        :param generation: The current data generation
+        :return: A read only view into the mapped snapshot file
+        """
+        path = self.get_path(key)
+        snapshot = self.read(path)
+        if snapshot is None or snapshot[0] != generation:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return snapshot[1]
+
+    def get_latest(self, name: str) -> Optional[Tuple[int, memoryview]]:
+        """Returns the generation and the JSON of the latest snapshot of a name.
+
+        The latest snapshot survives clear and is served as is, whichever day
+        or generation it got built on, e.g. while the service starts.
+        """
+        return self.read(self.get_latest_path(name))
+
+    def put(self, key: Hashable, generation: int, content: bytes):
+        """Writes the JSON of a report as the key's snapshot and removes the
+        least recently used snapshots beyond the bounds.
+
+        With max_snapshots 0 no snapshots are kept at all.
+        """
+        if self.max_snapshots <= 0:
+            return
+        path = self.get_path(key)
+        self.write(path, generation, content)
+        self.evict(keep=path)
+
+    def put_latest(self, name: str, generation: int, content: bytes):
+        """Writes the JSON of a report as the latest snapshot of a name."""
+        self.write(self.get_latest_path(name), generation, content)
+
+    def read(self, path: str) -> Optional[Tuple[int, memoryview]]:
+        try:
+            with open(path, "rb") as snapshot_file:
+                mapping = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        if len(mapping) < HEADER.size or mapping[: len(MAGIC)] != MAGIC:
+            mapping.close()
+            return None
+        _, generation, _ = HEADER.unpack_from(mapping)
+        return generation, memoryview(mapping)[HEADER.size :]
+
+    def write(self, path: str, generation: int, content: bytes):
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as snapshot_file:
+                snapshot_file.write(HEADER.pack(MAGIC, generation, time.time()))
+                snapshot_file.write(content)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def evict(self, keep: str):
+        """Removes the least recently used snapshots but the one to keep
+        until both bounds hold."""
+        snapshots = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".snapshot") and entry.path != keep:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                snapshots.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        snapshots.sort(reverse=True)
+        count = 1
+        size = os.path.getsize(keep)
+        for _, snapshot_size, path in snapshots:
+            count += 1
+            size += snapshot_size
+            if count > self.max_snapshots or size > self.max_bytes:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    @contextmanager
+    def lock(self, key: Hashable) -> Iterator[None]:
+        """Holds the key's lock, across processes and threads, in the block.
+
+        The keys share LOCK_STRIPES lock files, so their number stays bounded.
+        """
+        stripe = int(hashlib.sha1(repr(key).encode()).hexdigest(), 16) % LOCK_STRIPES
+        lock_path = os.path.join(self.directory, f"{stripe}.lock")
+        with open(lock_path, "wb") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def clear(self):
+        """Removes all snapshots but the latest ones, e.g. once the data
+        changed."""
+        for name in os.listdir(self.directory):
+            if name.endswith(".snapshot"):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
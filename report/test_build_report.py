@@ -1,19 +1,39 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 from pprint import pprint
 import pytest
 from dateutil.relativedelta import relativedelta
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from applications.database import create_database_engine
 from applications.models import Base, Application, Status
+from applications.rollup import rebuild_rollup
+from . import build_report as build_report_module
 from .build_report import (
+    REPORT_SECTIONS,
+    Granularity,
+    ReportParameters,
+    ReportWindow,
     build_report,
+    build_report_concurrently,
+    count_long_waiting_applications,
     create_annual_stat,
     get_application_status_per_research_area,
     get_approved_funding_given_month,
     get_avg_time_between_submitted_and_actioned,
+    get_bucket_key,
+    get_bucket_start,
+    get_bucket_starts,
+    get_daily_stats,
     get_long_waiting_applications,
     get_month_date_range,
+    get_monthly_stats,
     get_num_of_appl_given_status_month,
+    get_report_parameters,
 )
 
 
@@ -41,6 +61,59 @@ def session(engine):
     connection.close()
 
 
+@pytest.fixture(scope="session")
+def postgres_url():
+    """The URL of a PostgreSQL database, the tests using it skip without one.
+
+    TEST_POSTGRES_URL can point to a running server, otherwise a throwaway
+    server gets started with initdb and pg_ctl, if they are installed.
+    """
+    pytest.importorskip("psycopg2")
+    if os.environ.get("TEST_POSTGRES_URL"):
+        yield os.environ["TEST_POSTGRES_URL"]
+        return
+    initdb, pg_ctl = shutil.which("initdb"), shutil.which("pg_ctl")
+    if initdb is None or pg_ctl is None:
+        pytest.skip("PostgreSQL is not available")
+    from stub_api import get_free_port
+
+    data_dir = tempfile.mkdtemp(prefix="pg")
+    port = get_free_port()
+    subprocess.run(
+        [initdb, "-D", data_dir, "-U", "postgres", "--auth=trust"],
+        check=True,
+        capture_output=True,
+    )
+    subprocess.run(
+        [pg_ctl, "-D", data_dir, "-w", "-l", os.path.join(data_dir, "log")]
+        + ["-o", f"-p {port} -h 127.0.0.1 -k {data_dir}", "start"],
+        check=True,
+        capture_output=True,
+    )
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([pg_ctl, "-D", data_dir, "-m", "immediate", "stop"])
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def dialect_session(request, tmp_path):
+    """A session on an empty file SQLite and on a PostgreSQL database."""
+    if request.param == "sqlite":
+        url = f"sqlite:///{tmp_path}/applications.db"
+    else:
+        url = request.getfixturevalue("postgres_url")
+    engine = create_database_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
 @pytest.fixture
 def my_datetime():
     return datetime(2023, 1, 1, 13, 18, 11, 558836)
@@ -186,6 +259,43 @@ def test_applications(session):
         ),
     ]
     session.add_all(applications)
+    rebuild_rollup(session)
+    session.commit()
+    return applications
+
+
+@pytest.fixture
+def recent_applications(session):
+    """Applications spread over the last 12 months and a bit around them.
+
+    The dates are relative to today so that the annual statistic has
+    something to count, including the first and last day of a month and
+    months without any approved funding.
+    """
+    today = date.today()
+    statuses = ["submitted", "approved", "rejected"]
+    research_areas = ["mental_health", "infectious_disease", "climate_and_health"]
+    applications = []
+    for i in range(14):
+        month = today.replace(day=1) - relativedelta(months=i)
+        last_day = get_month_date_range(datetime(month.year, month.month, 1))[1]
+        for j, submitted_date in enumerate([month, last_day]):
+            for k, status in enumerate(statuses[: 1 + (i + j) % 3]):
+                actioned_date = None
+                if status == "approved" and i % 4 != 1:
+                    actioned_date = submitted_date + timedelta(days=3 * k + j)
+                applications.append(
+                    Application(
+                        application_id=f"recent-{i}-{j}-{k}",
+                        amount_awarded=1000 * (i + 1) + 10 * j + k,
+                        research_area=research_areas[(i + k) % 3],
+                        status=status,
+                        submitted_date=submitted_date,
+                        actioned_date=actioned_date,
+                    )
+                )
+    session.add_all(applications)
+    rebuild_rollup(session)
     session.commit()
     return applications
 
@@ -210,6 +320,24 @@ def test_get_long_waiting_applications(session, test_applications):
     assert len(long_waiting_application_ids) == 3
 
 
+def test_get_long_waiting_applications_in_pages(session, recent_applications):
+    all_application_ids = get_long_waiting_applications(session)
+    assert all_application_ids == sorted(all_application_ids)
+    assert len(all_application_ids) == count_long_waiting_applications(session) > 2
+    pages = []
+    after = None
+    while True:
+        page = get_long_waiting_applications(session, limit=2, after=after)
+        if not page:
+            break
+        pages.append(page)
+        after = page[-1]
+    assert all(len(page) <= 2 for page in pages)
+    assert [application_id for page in pages for application_id in page] == (
+        all_application_ids
+    )
+
+
 def test_create_annual_stat(session, test_applications):
     annual_stat = create_annual_stat(session)
     for i in range(12):
@@ -220,6 +348,45 @@ def test_create_annual_stat(session, test_applications):
         assert month_num in annual_stat[year]
 
 
+def test_create_annual_stat_matches_per_month_queries(session, recent_applications):
+    annual_stat = create_annual_stat(session)
+    expected = {}
+    for i in range(12):
+        month = datetime.today() - relativedelta(months=i)
+        expected.setdefault(month.year, {})[month.strftime("%m")] = {
+            "submitted": get_num_of_appl_given_status_month(session, month),
+            "approved": get_num_of_appl_given_status_month(
+                session, month, Status.approved
+            ),
+            "rejected": get_num_of_appl_given_status_month(
+                session, month, Status.rejected
+            ),
+            "approved_funding": get_approved_funding_given_month(session, month),
+        }
+    assert annual_stat == expected
+    assert list(annual_stat) == list(expected)
+    for year in expected:
+        assert list(annual_stat[year]) == list(expected[year])
+
+
+def test_get_monthly_stats(session, test_applications):
+    monthly_stats = get_monthly_stats(session, date(2023, 1, 1), date(2023, 3, 31))
+    assert monthly_stats == {
+        "2023-01": {
+            "submitted": 7,
+            "rejected": 3,
+            "approved": 1,
+            "approved_funding": 2000,
+        },
+        "2023-03": {
+            "submitted": 0,
+            "rejected": 0,
+            "approved": 1,
+            "approved_funding": 1000,
+        },
+    }
+
+
 def test_get_monthly_applications_with_given_status(
     session, test_applications, my_datetime
 ):
@@ -264,12 +431,59 @@ def test_build_report(session, test_applications):
         "status_per_research_area",
         "avg_processing_time",
         "long_waiting_application_ids",
+        "long_waiting_count",
     ]
     for key in keys_in_report:
         assert key in report.keys()
         assert report[key] is not None
 
 
+@pytest.fixture
+def file_session_factory(tmp_path):
+    """Sessions on a SQLite file holding the stub API's applications."""
+    from applications.crd import save_applications
+    from stub_api import create_items
+
+    engine = create_database_engine(f"sqlite:///{tmp_path}/applications.db")
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as session:
+        list(save_applications(session, create_items(100), 100))
+        rebuild_rollup(session)
+        session.commit()
+    yield session_factory
+    engine.dispose()
+
+
+def test_build_report_concurrently(file_session_factory):
+    with ThreadPoolExecutor(4) as executor:
+        report, generation, timings = build_report_concurrently(
+            file_session_factory, executor
+        )
+    with file_session_factory() as session:
+        assert report == build_report(session)
+    assert generation == 0
+    assert list(timings) == list(REPORT_SECTIONS)
+    assert all(seconds > 0 for seconds in timings.values())
+
+
+def test_build_report_concurrently_retries_mixed_generations(
+    monkeypatch, file_session_factory
+):
+    generations = iter(range(100))
+    monkeypatch.setattr(
+        build_report_module, "get_data_generation", lambda db: next(generations)
+    )
+    with ThreadPoolExecutor(2) as executor:
+        report, generation, timings = build_report_concurrently(
+            file_session_factory, executor, max_attempts=2
+        )
+    with file_session_factory() as session:
+        assert report == build_report(session)
+    assert generation == 2 * len(REPORT_SECTIONS)
+    assert list(timings) == ["build_report"]
+
+
 def test_get_month_date_range(my_datetime, my_feb_datetime):
     start_date, end_date = get_month_date_range(my_datetime)
     assert start_date == date(2023, 1, 1)
@@ -277,3 +491,150 @@ def test_get_month_date_range(my_datetime, my_feb_datetime):
     start_date, end_date = get_month_date_range(my_feb_datetime)
     assert start_date == date(2023, 2, 1)
     assert end_date == date(2023, 2, 28)
+
+
+def test_get_report_parameters():
+    today = date(2023, 5, 17)
+    assert get_report_parameters(today) == ReportParameters(
+        date(2022, 6, 1), date(2023, 5, 31), Granularity.month, 60
+    )
+    assert get_report_parameters(today, months=36).start_date == date(2020, 6, 1)
+    assert get_report_parameters(
+        today, window=ReportWindow.quarter_to_date
+    ) == ReportParameters(date(2023, 4, 1), today)
+    assert get_report_parameters(
+        today, window=ReportWindow.year_to_date, granularity="week", threshold_days=7
+    ) == ReportParameters(date(2023, 1, 1), today, Granularity.week, 7)
+    assert get_report_parameters(
+        today, start_date=date(2023, 2, 10)
+    ) == ReportParameters(date(2023, 2, 10), today)
+    with pytest.raises(ValueError):
+        get_report_parameters(today, months=3, window=ReportWindow.year_to_date)
+    with pytest.raises(ValueError):
+        get_report_parameters(today, end_date=date(2023, 2, 10))
+    with pytest.raises(ValueError):
+        get_report_parameters(today, start_date=date(2023, 6, 1))
+    assert get_report_parameters(
+        today, start_date=date(2013, 6, 1), end_date=date(2023, 5, 31)
+    ) == ReportParameters(date(2013, 6, 1), date(2023, 5, 31))
+    for start_date, end_date, granularity, threshold_days in [
+        (date(2013, 5, 31), date(2023, 5, 31), "month", 60),
+        (date(2026, 1, 1), date(9999, 12, 31), "month", 60),
+        (date(9999, 6, 1), date(9999, 12, 31), "quarter", 60),
+        (date(1, 1, 1), None, "week", 60),
+        (date(2023, 2, 10), None, "month", 10**9),
+    ]:
+        with pytest.raises(ValueError):
+            get_report_parameters(
+                today,
+                start_date=start_date,
+                end_date=end_date,
+                granularity=granularity,
+                threshold_days=threshold_days,
+            )
+
+
+def test_get_buckets():
+    assert get_bucket_start(date(2023, 5, 17), Granularity.week) == date(2023, 5, 15)
+    assert get_bucket_start(date(2023, 5, 17), Granularity.quarter) == date(2023, 4, 1)
+    assert get_bucket_key(date(2023, 5, 1), Granularity.month) == (2023, "05")
+    assert get_bucket_key(date(2023, 4, 1), Granularity.quarter) == (2023, 2)
+    assert get_bucket_key(date(2024, 12, 30), Granularity.week) == (2025, 1)
+    assert get_bucket_starts(
+        date(2023, 2, 10), date(2023, 7, 1), Granularity.quarter
+    ) == [date(2023, 1, 1), date(2023, 4, 1), date(2023, 7, 1)]
+    assert get_bucket_starts(
+        date(2023, 5, 17), date(2023, 5, 29), Granularity.week
+    ) == [date(2023, 5, 15), date(2023, 5, 22), date(2023, 5, 29)]
+
+
+def count_annual_stat(applications, parameters: ReportParameters) -> dict:
+    """Counts the annual statistic application by application."""
+    start_date, end_date, granularity, _ = parameters
+
+    def in_bucket(day, bucket_start):
+        return (
+            day is not None
+            and start_date <= day <= end_date
+            and get_bucket_start(day, granularity) == bucket_start
+        )
+
+    annual_stat = {}
+    for bucket_start in reversed(get_bucket_starts(start_date, end_date, granularity)):
+        approved = [
+            application
+            for application in applications
+            if application.status == Status.approved
+            and in_bucket(application.actioned_date, bucket_start)
+        ]
+        year, key = get_bucket_key(bucket_start, granularity)
+        annual_stat.setdefault(year, {})[key] = {
+            "submitted": sum(
+                in_bucket(application.submitted_date, bucket_start)
+                for application in applications
+            ),
+            "approved": len(approved),
+            "rejected": sum(
+                application.status == Status.rejected
+                and in_bucket(application.submitted_date, bucket_start)
+                for application in applications
+            ),
+            "approved_funding": sum(
+                application.amount_awarded for application in approved
+            )
+            if approved
+            else None,
+        }
+    return annual_stat
+
+
+@pytest.mark.parametrize(
+    "window",
+    [
+        {"months": 3},
+        {"months": 13, "granularity": "quarter"},
+        {"months": 6, "granularity": "week"},
+        {"window": ReportWindow.quarter_to_date},
+        {"window": ReportWindow.year_to_date, "granularity": "quarter"},
+        {"start_date": date.today() - timedelta(days=100), "granularity": "week"},
+        {"start_date": date.today() - timedelta(days=400)},
+    ],
+)
+def test_create_annual_stat_for_windows(session, recent_applications, window):
+    parameters = get_report_parameters(date.today(), **window)
+    annual_stat = create_annual_stat(session, parameters)
+    expected = count_annual_stat(recent_applications, parameters)
+    assert annual_stat == expected
+    assert list(annual_stat) == list(expected)
+    for year in expected:
+        assert list(annual_stat[year]) == list(expected[year])
+
+
+def test_daily_stats_add_up_to_monthly_stats(session, test_applications):
+    start_date, end_date = date(2022, 1, 1), date(2023, 12, 31)
+    daily_stats = get_daily_stats(session, start_date, end_date)
+    assert all(isinstance(day, date) for day in daily_stats)
+    monthly_stats = {}
+    for day, stat in daily_stats.items():
+        month_stat = monthly_stats.setdefault(
+            day.strftime("%Y-%m"), dict.fromkeys(stat, 0)
+        )
+        for key, value in stat.items():
+            month_stat[key] += value
+    for month_stat in monthly_stats.values():
+        if not month_stat["approved"]:
+            month_stat["approved_funding"] = None
+    assert monthly_stats == get_monthly_stats(session, start_date, end_date)
+
+
+def test_long_waiting_threshold(session, recent_applications):
+    counts = [
+        count_long_waiting_applications(session, threshold_days)
+        for threshold_days in (0, 60, 200)
+    ]
+    assert counts[0] > counts[1] > counts[2] > 0
+    assert len(get_long_waiting_applications(session, threshold_days=200)) == counts[2]
+    report = build_report(
+        session, get_report_parameters(date.today(), threshold_days=200)
+    )
+    assert report["long_waiting_count"] == counts[2]
@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from .cache import ReportCache, SingleFlight, SingleFlightFull
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_cache_hit_and_miss(clock):
+    cache = ReportCache(max_entries=2, ttl=60, clock=clock)
+    assert cache.get((1, "2023-01-01")) is None
+    cache.put((1, "2023-01-01"), {"avg_processing_time": 1}, b"{}")
+    cached_report = cache.get((1, "2023-01-01"))
+    assert cached_report.report == {"avg_processing_time": 1}
+    assert cached_report.content == b"{}"
+    assert cache.get((2, "2023-01-01")) is None
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 2,
+        "hit_rate": 1 / 3,
+        "entries": 1,
+        "max_entries": 2,
+    }
+
+
+def test_cache_evicts_least_recently_used(clock):
+    cache = ReportCache(max_entries=2, ttl=60, clock=clock)
+    cache.put(1, {}, b"1")
+    cache.put(2, {}, b"2")
+    cache.get(1)
+    cache.put(3, {}, b"3")
+    assert cache.get(2) is None
+    assert cache.get(1).content == b"1"
+    assert cache.get(3).content == b"3"
+
+
+def test_cache_expires_entries(clock):
+    cache = ReportCache(max_entries=2, ttl=60, clock=clock)
+    cache.put(1, {}, b"1")
+    clock.now = 60
+    assert cache.get(1) is not None
+    clock.now = 61
+    assert cache.get(1) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_single_flight_shares_the_call_in_flight():
+    release = threading.Event()
+    calls = []
+
+    def build(key):
+        calls.append(key)
+        release.wait(5)
+        return f"report {key}"
+
+    single_flight = SingleFlight(ThreadPoolExecutor(2))
+    submitted = [single_flight.submit(1, build, 1) for _ in range(10)]
+    other_future, other_started = single_flight.submit(2, build, 2)
+    assert [started for _, started in submitted] == [True] + [False] * 9
+    assert len({id(future) for future, _ in submitted}) == 1
+    assert len(single_flight) == 2
+    release.set()
+    assert [future.result(5) for future, _ in submitted] == ["report 1"] * 10
+    assert other_started and other_future.result(5) == "report 2"
+    assert sorted(calls) == [1, 2]
+    assert (single_flight.started, single_flight.joined) == (2, 9)
+
+    future, started = single_flight.submit(1, build, 1)
+    assert started and future.result(5) == "report 1"
+    assert len(single_flight) == 0
+
+
+def test_single_flight_shares_errors():
+    def fail():
+        raise ValueError("broken")
+
+    single_flight = SingleFlight(ThreadPoolExecutor(1))
+    future, _ = single_flight.submit("key", fail)
+    with pytest.raises(ValueError):
+        future.result(5)
+    assert len(single_flight) == 0
+
+
+def test_single_flight_ignores_done_calls_before_their_callback():
+    single_flight = SingleFlight(ThreadPoolExecutor(1), max_calls=1)
+    done = Future()
+    done.set_result("old report")
+    single_flight._calls["key"] = done
+    assert len(single_flight) == 0
+    single_flight._calls["key"] = done
+    future, started = single_flight.submit("key", lambda: "new report")
+    assert started and future.result(5) == "new report"
+
+
+def test_single_flight_rejects_calls_beyond_max_calls():
+    release = threading.Event()
+    single_flight = SingleFlight(ThreadPoolExecutor(1), max_calls=2)
+    running, _ = single_flight.submit(1, release.wait, 5)
+    queued, _ = single_flight.submit(2, release.wait, 5)
+    assert single_flight.submit(1, release.wait, 5)[0] is running
+    with pytest.raises(SingleFlightFull):
+        single_flight.submit(3, release.wait, 5)
+    assert single_flight.rejected == 1
+    release.set()
+    assert running.result(5) and queued.result(5)
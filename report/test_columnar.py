@@ -0,0 +1,66 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from applications.models import Application
+from .build_report import ReportWindow, build_report, get_report_parameters
+from .columnar import NO_DAY, ColumnarApplications, ColumnarStore
+from .test_build_report import engine, recent_applications, session, test_applications
+
+
+def assert_same_report(session, parameters=None):
+    expected = build_report(session, parameters)
+    report = ColumnarApplications.from_db(session).build_report(
+        date.today(), parameters
+    )
+    long_waiting_application_ids = report.pop("long_waiting_application_ids")
+    assert sorted(long_waiting_application_ids) == sorted(
+        expected.pop("long_waiting_application_ids")
+    )
+    assert report == expected
+    assert list(report["annual_stat"]) == list(expected["annual_stat"])
+
+
+def test_columnar_report_matches_sql(session, test_applications):
+    assert_same_report(session)
+
+
+def test_columnar_report_matches_sql_for_recent_data(session, recent_applications):
+    assert_same_report(session)
+
+
+@pytest.mark.parametrize(
+    "window",
+    [
+        {"months": 36, "granularity": "quarter"},
+        {"window": ReportWindow.quarter_to_date, "granularity": "week"},
+        {"start_date": date(2022, 12, 15), "end_date": date(2023, 2, 20)},
+        {"threshold_days": 200},
+    ],
+)
+def test_columnar_report_matches_sql_for_windows(session, recent_applications, window):
+    assert_same_report(session, get_report_parameters(date.today(), **window))
+
+
+def test_columnar_applications_dtypes(session, test_applications):
+    applications = ColumnarApplications.from_db(session)
+    assert applications.statuses.dtype == np.uint8
+    assert applications.submitted_days.dtype == np.int32
+    assert applications.actioned_days.dtype == np.int32
+    assert applications.amounts_awarded.dtype == np.int64
+    assert sorted(applications.research_areas) == [
+        "climate_and_health",
+        "infectious_disease",
+        "mental_health",
+    ]
+    assert (applications.actioned_days == NO_DAY).sum() == 6
+
+
+def test_columnar_store_reloads_on_new_generation(session, test_applications):
+    store = ColumnarStore()
+    applications = store.get(session, 1)
+    assert store.get(session, 1) is applications
+    session.query(Application).delete()
+    assert len(store.get(session, 1).application_ids) == 10
+    assert len(store.get(session, 2).application_ids) == 0
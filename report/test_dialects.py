@@ -0,0 +1,194 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import CompileError
+
+from applications.crd import save_applications, upsert_applications
+from applications.dialects import epoch_days, month_bucket, to_copy_text
+from applications.models import Application, Status, to_epoch_day
+from applications.rollup import check_rollup, rebuild_rollup
+from stub_api import create_items
+from .build_report import (
+    build_report,
+    count_long_waiting_applications,
+    get_approved_funding_given_month,
+    get_avg_time_between_submitted_and_actioned,
+    get_daily_stats,
+    get_long_waiting_applications,
+    get_num_of_appl_given_status_month,
+)
+from .columnar import ColumnarApplications
+from .test_build_report import dialect_session, postgres_url
+
+
+def compile_for(statement, dialect) -> str:
+    return str(statement.compile(dialect=dialect))
+
+
+def test_month_bucket_per_dialect():
+    statement = select(month_bucket(Application.submitted_date))
+    assert "strftime('%Y-%m', applications.submitted_date)" in compile_for(
+        statement, sqlite.dialect()
+    )
+    assert (
+        "to_char(date_trunc('month', applications.submitted_date), 'YYYY-MM')"
+        in compile_for(statement, postgresql.dialect())
+    )
+
+
+def test_epoch_days_per_dialect():
+    statement = select(epoch_days(Application.submitted_date))
+    assert (
+        "CAST(julianday(applications.submitted_date) - 2440587.5 AS INTEGER)"
+        in compile_for(statement, sqlite.dialect())
+    )
+    assert "(applications.submitted_date - DATE '1970-01-01')" in compile_for(
+        statement, postgresql.dialect()
+    )
+
+
+def test_unsupported_dialect():
+    from sqlalchemy.dialects import mysql
+
+    with pytest.raises(CompileError):
+        compile_for(select(month_bucket(Application.submitted_date)), mysql.dialect())
+
+
+def test_to_copy_text():
+    assert to_copy_text(None) == "\\N"
+    assert to_copy_text(date(2023, 4, 1)) == "2023-04-01"
+    assert to_copy_text(Status.approved) == "approved"
+    assert to_copy_text(1200) == "1200"
+    assert to_copy_text("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
+
+
+def test_report_on_every_dialect(dialect_session):
+    items = create_items(200)
+    items[0]["summary"] = "Tabs\tand\nnew lines \\ survive"
+    assert sum(save_applications(dialect_session, items, 64)) == 200
+    rebuild_rollup(dialect_session)
+    dialect_session.commit()
+    assert check_rollup(dialect_session) == []
+    assert dialect_session.get(Application, 1).summary == items[0]["summary"]
+    assert (
+        build_report(dialect_session)
+        == ColumnarApplications.from_db(dialect_session).build_report()
+    )
+
+
+def test_upsert_on_every_dialect(dialect_session):
+    items = create_items(20)
+    list(save_applications(dialect_session, items, 10))
+    rebuild_rollup(dialect_session)
+    dialect_session.commit()
+    items[0]["status"] = "rejected"
+    counts = sum(upsert_applications(dialect_session, items, 10), start=Counter())
+    assert (counts["updated"], counts["unchanged"]) == (1, 19)
+    assert check_rollup(dialect_session) == []
+
+
+@pytest.fixture
+def stub_applications(dialect_session):
+    list(save_applications(dialect_session, create_items(1000), 300))
+    dialect_session.commit()
+
+
+def test_epoch_days_match_the_dates(dialect_session, stub_applications):
+    db = dialect_session
+    for submitted_date, submitted_day, actioned_date, actioned_day in db.query(
+        Application.submitted_date,
+        epoch_days(Application.submitted_date),
+        Application.actioned_date,
+        epoch_days(Application.actioned_date),
+    ):
+        assert submitted_day == to_epoch_day(submitted_date)
+        assert actioned_day == to_epoch_day(actioned_date)
+    assert (
+        db.query(Application)
+        .filter(
+            or_(
+                Application.submitted_day != epoch_days(Application.submitted_date),
+                Application.actioned_day != epoch_days(Application.actioned_date),
+            )
+        )
+        .count()
+        == 0
+    )
+
+
+def test_report_queries_match_the_date_queries(dialect_session, stub_applications):
+    """The queries on the epoch days give the results the ones on the dates
+    gave before."""
+    db = dialect_session
+    avg_days_to_actioned = (
+        db.query(
+            func.avg(
+                epoch_days(Application.actioned_date)
+                - epoch_days(Application.submitted_date)
+            )
+        )
+        .filter(
+            Application.actioned_date.isnot(None),
+            Application.status.in_([Status.approved, Status.rejected]),
+        )
+        .scalar()
+    )
+    assert get_avg_time_between_submitted_and_actioned(db) == round(
+        avg_days_to_actioned
+    )
+
+    for threshold_days in (0, 60, 400):
+        long_waiting_ids = [
+            application_id
+            for application_id, in db.query(Application.application_id)
+            .filter(
+                Application.status == Status.submitted,
+                Application.submitted_date
+                <= datetime.now() - timedelta(days=threshold_days),
+            )
+            .order_by(Application.application_id)
+        ]
+        assert get_long_waiting_applications(db, threshold_days=threshold_days) == (
+            long_waiting_ids
+        )
+        assert count_long_waiting_applications(db, threshold_days) == len(
+            long_waiting_ids
+        )
+
+    start_date, end_date = date.today() - timedelta(days=400), date.today()
+    for day, stat in get_daily_stats(db, start_date, end_date).items():
+        submitted = db.query(Application).filter(Application.submitted_date == day)
+        approved = db.query(Application).filter(
+            Application.actioned_date == day, Application.status == Status.approved
+        )
+        assert stat["submitted"] == submitted.count()
+        assert stat["approved"] == approved.count()
+    month_date = datetime.combine(
+        date.today() - timedelta(days=200), datetime.min.time()
+    )
+    month_start = month_date.date().replace(day=1)
+    month_end = (month_start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    in_month = and_(
+        Application.submitted_date >= month_start,
+        Application.submitted_date <= month_end,
+    )
+    assert get_num_of_appl_given_status_month(db, month_date) == (
+        db.query(Application).filter(in_month).count()
+    )
+    assert get_num_of_appl_given_status_month(db, month_date, Status.rejected) == (
+        db.query(Application)
+        .filter(in_month, Application.status == Status.rejected)
+        .count()
+    )
+    assert get_approved_funding_given_month(db, month_date) == (
+        db.query(func.sum(Application.amount_awarded))
+        .filter(
+            Application.actioned_date >= month_start,
+            Application.actioned_date <= month_end,
+            Application.status == Status.approved,
+        )
+        .scalar()
+    )
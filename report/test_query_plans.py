@@ -0,0 +1,80 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event
+
+from applications.models import Status
+from applications.rollup import rebuild_rollup
+from .build_report import (
+    Granularity,
+    ReportParameters,
+    build_report,
+    get_approved_funding_given_month,
+    get_long_waiting_applications,
+    get_num_of_appl_given_status_month,
+)
+from .test_build_report import engine, session, test_applications
+
+
+@pytest.fixture
+def captured_queries(engine):
+    queries = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            queries.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield queries
+    event.remove(engine, "before_cursor_execute", capture)
+
+
+def get_full_scans(session, queries) -> list:
+    """Returns the plan steps of the queries which scan a table."""
+    full_scans = []
+    for statement, parameters in queries:
+        for row in session.connection().exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ):
+            detail = row[-1]
+            if detail.startswith("SCAN") and "COVERING INDEX" not in detail:
+                full_scans.append(f"{detail}: {statement}")
+    return full_scans
+
+
+def test_report_queries_use_indexes(session, test_applications, captured_queries):
+    build_report(session)
+    month_date = datetime(2023, 3, 1)
+    for status in Status:
+        get_num_of_appl_given_status_month(session, month_date, status)
+    get_approved_funding_given_month(session, month_date)
+    build_report(
+        session,
+        ReportParameters(date(2022, 1, 10), date(2023, 3, 1), Granularity.week),
+    )
+    assert len(captured_queries) >= 13
+    assert get_full_scans(session, captured_queries) == []
+
+
+def test_long_waiting_pages_are_read_in_index_order(
+    session, test_applications, captured_queries
+):
+    get_long_waiting_applications(session, limit=10, after="4f5f4397")
+    ((statement, parameters),) = captured_queries
+    plan = [
+        row[-1]
+        for row in session.connection().exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+    ]
+    assert plan == [
+        "SEARCH applications USING COVERING INDEX "
+        "ix_applications_status_application_id (status=? AND application_id>?)"
+    ]
+
+
+def test_rollup_rebuild_reads_a_covering_index(
+    session, test_applications, captured_queries
+):
+    rebuild_rollup(session)
+    assert get_full_scans(session, captured_queries) == []
@@ -0,0 +1,60 @@
+from datetime import date
+
+import numpy as np
+import orjson
+import pytest
+from pydantic import ValidationError
+
+from .build_report import build_report
+from .columnar import ColumnarApplications
+from .schemas import Report
+from .serialize import serialize_report
+from .test_build_report import engine, recent_applications, session, test_applications
+
+
+def assert_conforms(report: dict):
+    expected = Report.parse_obj(report).json(separators=(",", ":")).encode()
+    assert serialize_report(report, validate=False) == expected
+    assert serialize_report(report, validate=True) == expected
+    assert Report.parse_raw(serialize_report(report)) == Report.parse_obj(report)
+
+
+def test_serialize_report_conforms_to_schema(session, test_applications):
+    assert_conforms(build_report(session))
+
+
+def test_serialize_recent_report_conforms_to_schema(session, recent_applications):
+    report = build_report(session)
+    assert report["long_waiting_count"] > 0
+    assert_conforms(report)
+
+
+def test_serialize_columnar_report_conforms_to_schema(session, recent_applications):
+    assert_conforms(ColumnarApplications.from_db(session).build_report(date.today()))
+
+
+def test_serialize_report_types(session, recent_applications):
+    report = build_report(session)
+    report["avg_processing_time"] = np.int64(12)
+    report["long_waiting_count"] = np.int64(report["long_waiting_count"])
+    year = next(iter(report["annual_stat"]))
+    month = next(iter(report["annual_stat"][year]))
+    report["annual_stat"][year][month]["approved_funding"] = 1000
+    report["status_per_research_area"]["unknown_area"] = report[
+        "status_per_research_area"
+    ]["mental_health"]
+    assert_conforms(report)
+    content = orjson.loads(serialize_report(report))
+    assert list(content) == list(Report.__fields__)
+    assert content["avg_processing_time"] == 12.0
+    assert content["annual_stat"][str(year)][str(int(month))]["approved_funding"] == (
+        1000.0
+    )
+    assert "unknown_area" not in content["status_per_research_area"]
+
+
+def test_serialize_report_validates(session, test_applications):
+    report = build_report(session)
+    del report["status_per_research_area"]["mental_health"]["approved"]
+    with pytest.raises(ValidationError):
+        serialize_report(report, validate=True)
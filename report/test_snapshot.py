@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import time
+from datetime import date
+
+import pytest
+
+from .snapshot import HEADER, ReportSnapshots, get_snapshot_directory
+
+KEY = (date(2023, 5, 17), "sql", None)
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    return ReportSnapshots(str(tmp_path))
+
+
+def test_snapshot_round_trip(snapshots):
+    assert snapshots.get(KEY, 1) is None
+    snapshots.put(KEY, 1, b'{"avg_processing_time":1.0}')
+    content = snapshots.get(KEY, 1)
+    assert isinstance(content, memoryview)
+    assert content == b'{"avg_processing_time":1.0}'
+    assert snapshots.get(KEY, 2) is None
+    assert snapshots.get((date(2023, 5, 18), "sql", None), 1) is None
+
+
+def test_snapshot_views_survive_replacement_and_clear(snapshots):
+    snapshots.put(KEY, 1, b"first")
+    content = snapshots.get(KEY, 1)
+    snapshots.put(KEY, 2, b"second")
+    assert content == b"first"
+    assert snapshots.get(KEY, 2) == b"second"
+    snapshots.clear()
+    assert content == b"first"
+    assert snapshots.get(KEY, 2) is None
+    assert not any(name.endswith(".tmp") for name in os.listdir(snapshots.directory))
+
+
+def test_latest_snapshot_survives_clear(snapshots):
+    assert snapshots.get_latest("sql") is None
+    snapshots.put_latest("sql", 3, b"latest")
+    snapshots.clear()
+    generation, content = snapshots.get_latest("sql")
+    assert generation == 3
+    assert content == b"latest"
+    assert ReportSnapshots(snapshots.directory).get_latest("columnar") is None
+
+
+def test_snapshot_ignores_broken_files(snapshots):
+    open(snapshots.get_path(KEY), "wb").close()
+    assert snapshots.get(KEY, 1) is None
+    with open(snapshots.get_path(KEY), "wb") as snapshot_file:
+        snapshot_file.write(b"not a snapshot at all")
+    assert snapshots.get(KEY, 1) is None
+
+
+def test_least_recently_used_snapshots_are_removed(tmp_path):
+    snapshots = ReportSnapshots(str(tmp_path), max_snapshots=2)
+    keys = [(date(2023, 5, 17), "sql", months) for months in range(4)]
+    snapshots.put(keys[0], 1, b"0")
+    snapshots.put(keys[1], 1, b"1")
+    os.utime(snapshots.get_path(keys[1]), ns=(0, 0))
+    assert snapshots.get(keys[0], 1) == b"0"
+    snapshots.put(keys[2], 1, b"2")
+    assert snapshots.get(keys[1], 1) is None
+    assert snapshots.get(keys[0], 1) == b"0"
+    assert snapshots.get(keys[2], 1) == b"2"
+    snapshots.max_bytes = HEADER.size + 1
+    snapshots.put(keys[3], 1, b"3")
+    assert [snapshots.get(key, 1) for key in keys] == [None, None, None, b"3"]
+    snapshots.put_latest("sql", 1, b"latest")
+    snapshots.put(keys[0], 1, b"0")
+    assert snapshots.get_latest("sql")[1] == b"latest"
+    snapshots.max_snapshots = 0
+    snapshots.put(keys[1], 1, b"1")
+    assert snapshots.get(keys[1], 1) is None
+
+
+def build_once(directory: str, builds):
+    snapshots = ReportSnapshots(directory)
+    with snapshots.lock(KEY):
+        if snapshots.get(KEY, 1) is None:
+            with builds.get_lock():
+                builds.value += 1
+            time.sleep(0.1)
+            snapshots.put(KEY, 1, b"report")
+    return bytes(snapshots.get(KEY, 1))
+
+
+def test_only_one_process_builds_the_snapshot(tmp_path):
+    builds = multiprocessing.Value("i", 0)
+    processes = [
+        multiprocessing.Process(target=build_once, args=(str(tmp_path), builds))
+        for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(10)
+        assert process.exitcode == 0
+    assert builds.value == 1
+    assert ReportSnapshots(str(tmp_path)).get(KEY, 1) == b"report"
+
+
+def test_get_snapshot_directory(tmp_path):
+    assert get_snapshot_directory(f"sqlite:///{tmp_path}/applications.db") == (
+        f"{tmp_path}/applications.db-snapshots"
+    )
+    assert get_snapshot_directory("sqlite://") != get_snapshot_directory(
+        "postgresql://user@localhost/other"
+    )
+    assert get_snapshot_directory("postgresql://user@localhost/applications") == (
+        get_snapshot_directory("postgresql://user@localhost/applications")
+    )
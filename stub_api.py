@@ -0,0 +1,110 @@
+import argparse
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Iterator, List, Optional, Sequence
+
+import uvicorn
+from fastapi import FastAPI, Response
+
+
+class StubAPI:
+    """A local stand-in for the grants API.
+
+    It pages through the given items with the same skip and limit parameters
+    and the same JSON format as the real API. To test the error handling it
+    can answer with an error, fail the first requests or the requests for
+    some skip offsets with a transient error or return a malformed JSON.
+    """
+
+    def __init__(self, items: Sequence[dict]):
+        self.items = items
+        self.error: Optional[tuple] = None
+        self.transient_failures = 0
+        self.failing_skips = set()
+        self.malformed = False
+        self.requested_skips = []
+        self.app = FastAPI()
+        self.app.get("/api")(self.get_page)
+
+    def get_page(self, skip: int = 0, limit: int = 50000):
+        """Returns a page of the items like the grants API does."""
+        if self.error:
+            status_code, text = self.error
+            return Response(content=text, status_code=status_code)
+        if self.transient_failures > 0 or skip in self.failing_skips:
+            self.transient_failures = max(self.transient_failures - 1, 0)
+            return Response(content="Service Unavailable", status_code=503)
+        self.requested_skips.append(skip)
+        if self.malformed:
+            return {"foobar": "barfoo"}
+        return {
+            "available_records": len(self.items),
+            "items": self.items[skip : skip + limit],
+        }
+
+
+def create_items(num_of_items: int) -> List[dict]:
+    """Creates a list of API items which pass the validation."""
+    statuses = ["submitted", "approved", "rejected"]
+    research_areas = ["mental_health", "infectious_disease", "climate_and_health"]
+    first_date = date.today() - timedelta(days=730)
+    items = []
+    for i in range(num_of_items):
+        status = statuses[i % 3]
+        submitted_date = first_date + timedelta(days=i % 700)
+        actioned_date = None
+        if status == "approved":
+            actioned_date = (submitted_date + timedelta(days=i % 90)).isoformat()
+        items.append(
+            {
+                "application_id": f"stub-{i}",
+                "lead_applicant_name": "Jane Doe",
+                "lead_applicant_email": "janedoe@example.com",
+                "lead_applicant_address": "Main St 1",
+                "organisation_name": "Org",
+                "summary": "Lorem ipsum",
+                "amount_awarded": 1000 + i % 5000,
+                "research_area": research_areas[i % 7 % 3],
+                "status": status,
+                "submitted_date": submitted_date.isoformat(),
+                "actioned_date": actioned_date,
+            }
+        )
+    return items
+
+
+def get_free_port() -> int:
+    """Asks the OS for a port nobody is listening on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve_stub_api(stub_api: StubAPI) -> Iterator[str]:
+    """Runs the stub API in a background thread and yields its URL."""
+    port = get_free_port()
+    config = uvicorn.Config(stub_api.app, port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}/api"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    from benchmarks.synthetic import SyntheticApplications
+
+    parser = argparse.ArgumentParser(description="Serve a stub grants API.")
+    parser.add_argument("--records", type=int, default=110000)
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    uvicorn.run(StubAPI(SyntheticApplications(args.records)).app, port=args.port)
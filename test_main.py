@@ -1,9 +1,29 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
 from fastapi import HTTPException
+import httpx
 import pytest
-from main import app, check_for_api_token, empty_table, load_applications
+import main
+from main import (
+    app,
+    check_for_api_token,
+    empty_table,
+    load_applications,
+    report_cache,
+)
 from fastapi.testclient import TestClient
 from applications.database import SessionLocal
+from applications.models import Application
+from concurrent.futures import ThreadPoolExecutor
+from report.cache import ReportCache, SingleFlight
+from report.schemas import Report
+from report.snapshot import ReportSnapshots
 from report.test_build_report import test_applications, session, engine
+from stub_api import StubAPI, create_items, serve_stub_api
 
 client = TestClient(app)
 test_db = SessionLocal()
@@ -20,50 +40,551 @@ def test_read_main():
     }
 
 
-def test_load_applications_fail(monkeypatch):
-    monkeypatch.setenv("API_TOKEN", "test_token")
+@pytest.fixture(autouse=True)
+def report_snapshots(monkeypatch, tmp_path):
+    snapshots = ReportSnapshots(str(tmp_path / "snapshots"))
+    monkeypatch.setattr("main.report_snapshots", snapshots)
+    return snapshots
 
-    def mock_requests_get(url, headers, params):
-        return type(
-            "Response", (object,), {"status_code": 400, "text": "Bad Request"}
-        )()
 
-    monkeypatch.setattr("main.requests.get", mock_requests_get)
-    response = client.post("/load_applications/")
+@pytest.fixture
+def stub_api(monkeypatch):
+    stub = StubAPI(create_items(3))
+    with serve_stub_api(stub) as url:
+        monkeypatch.setattr("main.API_URL", url)
+        monkeypatch.setattr("main.API_RETRY_BACKOFF", 0)
+        monkeypatch.setenv("API_TOKEN", "test_token")
+        yield stub
+
+
+def test_load_applications_fail(stub_api):
+    stub_api.error = (400, "Bad Request")
+    response = client.post("/load_applications/", params={"wait": True})
     assert response.status_code == 400
     assert response.json() == {
         "detail": "There was a problem trying to access the API: Bad " "Request"
     }
 
 
-def test_load_applications_key_error(monkeypatch):
-    def mock_requests_get(url, headers, params):
-        return type(
-            "Response",
-            (object,),
-            {"status_code": 200, "json": lambda _: {"foobar": "barfoo"}},
-        )()
-
-    monkeypatch.setattr("main.requests.get", mock_requests_get)
-    response = client.post("/load_applications/")
+def test_load_applications_key_error(stub_api):
+    stub_api.malformed = True
+    response = client.post("/load_applications/", params={"wait": True})
     assert response.status_code == 400
     assert response.json() == {
         "detail": "The response did not return the expected JSON."
     }
 
 
+def test_load_applications_in_pages(monkeypatch, stub_api):
+    monkeypatch.setattr("main.API_PAGE_SIZE", 2)
+    monkeypatch.setattr("main.LOAD_CHUNK_SIZE", 1)
+    stub_api.items = create_items(7)
+    response = client.post("/load_applications/", params={"mode": "full", "wait": True})
+    assert response.status_code == 200
+    assert response.json()["message"] == (
+        "7 applications successfully loaded into database."
+    )
+    assert response.json()["inserted"] == 7
+    assert sorted(stub_api.requested_skips) == [0, 2, 4, 6]
+    empty_table(test_db)
+
+
+def test_load_applications_incrementally(stub_api):
+    empty_table(test_db)
+    response = client.post("/load_applications/", params={"wait": True})
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 3
+    stub_api.items[0]["status"] = "rejected"
+    stub_api.items.append(create_items(4)[3])
+    response = client.post(
+        "/load_applications/", params={"mode": "incremental", "wait": True}
+    )
+    assert response.status_code == 200
+    response_json = response.json()
+    assert response_json["message"] == (
+        "4 applications successfully loaded into database."
+    )
+    assert (
+        response_json["inserted"],
+        response_json["updated"],
+        response_json["unchanged"],
+    ) == (1, 1, 2)
+    assert "high_water_mark" not in response_json
+    empty_table(test_db)
+
+
+def test_failed_full_load_keeps_previous_data(monkeypatch, stub_api):
+    empty_table(test_db)
+    client.post("/load_applications/", params={"wait": True})
+    monkeypatch.setattr("main.API_PAGE_SIZE", 2)
+    monkeypatch.setattr("main.API_MAX_RETRIES", 0)
+    stub_api.items = create_items(7)
+    stub_api.failing_skips = {4}
+    response = client.post("/load_applications/", params={"mode": "full", "wait": True})
+    assert response.status_code == 503
+    assert test_db.query(Application).count() == 3
+    empty_table(test_db)
+
+
+def test_load_applications_retries_transient_errors(stub_api):
+    stub_api.transient_failures = 2
+    response = client.post("/load_applications/", params={"mode": "full", "wait": True})
+    assert response.status_code == 200
+    assert response.json()["message"] == (
+        "3 applications successfully loaded into database."
+    )
+    empty_table(test_db)
+
+
+def test_load_applications_gives_up_after_max_retries(monkeypatch, stub_api):
+    monkeypatch.setattr("main.API_MAX_RETRIES", 1)
+    stub_api.transient_failures = 2
+    response = client.post("/load_applications/", params={"wait": True})
+    assert response.status_code == 503
+
+
+def test_report_is_cached_per_data_generation(stub_api):
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    first_response = client.get("/report/")
+    assert first_response.status_code == 200
+    assert first_response.headers["X-Report-Cache"] == "miss"
+    assert [
+        timing.split(";dur=")[0]
+        for timing in first_response.headers["Server-Timing"].split(", ")
+    ] == [
+        "status_per_research_area",
+        "annual_stat",
+        "avg_processing_time",
+        "long_waiting_count",
+        "long_waiting_application_ids",
+    ]
+    second_response = client.get("/report/")
+    assert second_response.headers["X-Report-Cache"] == "hit"
+    assert second_response.content == first_response.content
+    assert Report.parse_raw(second_response.content)
+
+    client.post("/load_applications/", params={"wait": True})
+    assert client.get("/report/").headers["X-Report-Cache"] == "hit"
+    stub_api.items[0]["status"] = "rejected"
+    client.post("/load_applications/", params={"wait": True})
+    assert client.get("/report/").headers["X-Report-Cache"] == "miss"
+    assert report_cache.stats()["hits"] >= 2
+    empty_table(test_db)
+
+
+def test_metrics(stub_api):
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    client.get("/report/")
+    client.get("/report/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    metrics = response.text
+    for sample in [
+        'report_section_seconds_count{section="annual_stat"}',
+        'report_build_seconds_count{backend="sql"}',
+        'sql_statement_seconds_count{statement="SELECT applications"}',
+        'api_page_fetch_seconds_count{status="200"}',
+        'load_rows_written_total{mode="full"}',
+        "load_rows_per_second ",
+        "report_cache_hits_total ",
+        "report_cache_hit_ratio ",
+    ]:
+        assert sample in metrics
+    empty_table(test_db)
+
+
+def test_report_build_seconds_are_the_wall_time(monkeypatch, stub_api):
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    build_report_concurrently = main.build_report_concurrently
+
+    def build_with_concurrent_sections(*args, **kwargs):
+        report_dict, generation, _ = build_report_concurrently(*args, **kwargs)
+        return report_dict, generation, {"annual_stat": 60.0, "status": 60.0}
+
+    monkeypatch.setattr(
+        "main.build_report_concurrently", build_with_concurrent_sections
+    )
+    build_seconds = main.report_build_seconds.get_sum(backend="sql")
+    section_seconds = main.report_section_seconds.get_sum(section="annual_stat")
+    client.get("/report/", params={"months": 2})
+    assert main.report_section_seconds.get_sum(section="annual_stat") == (
+        section_seconds + 60
+    )
+    assert main.report_build_seconds.get_sum(backend="sql") - build_seconds < 60
+    empty_table(test_db)
+
+
+def test_long_waiting_application_ids(monkeypatch, stub_api):
+    monkeypatch.setattr("report.build_report.LONG_WAITING_PREVIEW_SIZE", 5)
+    stub_api.items = create_items(60)
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    expected = sorted(
+        item["application_id"]
+        for item in stub_api.items
+        if item["status"] == "submitted"
+        and date.fromisoformat(item["submitted_date"])
+        <= date.today() - timedelta(days=60)
+    )
+    report = client.get("/report/").json()
+    assert report["long_waiting_count"] == len(expected)
+    assert len(expected) > 5
+    assert report["long_waiting_application_ids"] == expected[:5]
+
+    application_ids, after = [], None
+    while True:
+        page = client.get(
+            "/report/long_waiting_application_ids",
+            params={"limit": 7, **({"after": after} if after else {})},
+        ).json()
+        application_ids.extend(page["application_ids"])
+        after = page["next_after"]
+        if after is None:
+            break
+    assert application_ids == expected
+
+    response = client.get(
+        "/report/long_waiting_application_ids",
+        params={"format": "ndjson", "limit": 3},
+    )
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [
+        json.loads(line)["application_id"] for line in response.text.splitlines()
+    ] == expected
+    empty_table(test_db)
+
+
+def test_report_backends_agree(stub_api):
+    stub_api.items = create_items(50)
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    sql_report = client.get("/report/", params={"backend": "sql"}).json()
+    columnar_report = client.get("/report/", params={"backend": "columnar"}).json()
+    assert columnar_report == sql_report
+    empty_table(test_db)
+
+
+def test_report_parameters(stub_api):
+    stub_api.items = create_items(200)
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    default_report = client.get("/report/").json()
+    assert client.get("/report/", params={"months": 12}).json() == default_report
+    for params in [
+        {"months": 36, "granularity": "quarter"},
+        {"window": "quarter_to_date", "granularity": "week"},
+        {"start": "2021-03-15", "end": str(date.today()), "threshold_days": 650},
+    ]:
+        response = client.get("/report/", params=params)
+        assert response.status_code == 200
+        assert response.headers["X-Report-Cache"] == "miss"
+        assert client.get("/report/", params=params).headers["X-Report-Cache"] == (
+            "hit"
+        )
+        columnar_report = client.get(
+            "/report/", params={**params, "backend": "columnar"}
+        ).json()
+        assert columnar_report == response.json() != default_report
+    quarterly_stat = client.get(
+        "/report/", params={"months": 36, "granularity": "quarter"}
+    ).json()["annual_stat"]
+    assert sum(len(quarters) for quarters in quarterly_stat.values()) in (12, 13)
+    assert (
+        client.get("/report/", params={"threshold_days": 650}).json()[
+            "long_waiting_count"
+        ]
+        < default_report["long_waiting_count"]
+    )
+    for params in [
+        {"months": 3, "window": "year_to_date"},
+        {"start": str(date.today()), "end": "2020-01-01"},
+        {"start": "2026-01-01", "end": "9999-12-31"},
+        {"start": "0001-01-01", "granularity": "week"},
+        {"threshold_days": 10**9},
+    ]:
+        assert client.get("/report/", params=params).status_code == 422
+    assert (
+        client.get(
+            "/report/long_waiting_application_ids",
+            params={"threshold_days": 10**19},
+        ).status_code
+        == 422
+    )
+    empty_table(test_db)
+
+
+def test_report_is_shared_through_snapshots(monkeypatch, stub_api, report_snapshots):
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    built_response = client.get("/report/")
+    assert built_response.headers["X-Report-Cache"] == "miss"
+
+    def fail_build(*args):
+        raise AssertionError("The report should be served from the snapshot")
+
+    with monkeypatch.context() as patch:
+        patch.setattr("main.report_cache", ReportCache(16, 3600))
+        patch.setattr("main.build_report_snapshot", fail_build)
+        response = client.get("/report/")
+        assert response.headers["X-Report-Cache"] == "hit"
+        assert response.headers["content-length"] == str(len(built_response.content))
+        assert response.content == built_response.content
+        assert client.get("/report/").headers["X-Report-Cache"] == "hit"
+        assert main.report_cache.stats()["hits"] == 1
+
+    stub_api.items[0]["status"] = "rejected"
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    assert not any(
+        name.endswith(".snapshot") for name in os.listdir(report_snapshots.directory)
+    )
+    assert client.get("/report/").headers["X-Report-Cache"] == "miss"
+    empty_table(test_db)
+
+
+def test_report_warm_start(monkeypatch, stub_api, report_snapshots):
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    built_content = client.get("/report/").content
+    empty_table(test_db)
+    monkeypatch.setattr("main.report_cache", ReportCache(16, 3600))
+    stub_api.items = create_items(10)
+    refreshed = threading.Event()
+    refresh_latest_report = main.refresh_latest_report
+
+    def wait_for_refresh(backend):
+        refreshed.wait(10)
+        refresh_latest_report(backend)
+
+    monkeypatch.setattr("main.refresh_latest_report", wait_for_refresh)
+    with TestClient(app) as restarted_client:
+        start = time.perf_counter()
+        response = restarted_client.get("/report/")
+        assert time.perf_counter() - start < 1
+        assert response.status_code == 200
+        assert response.headers["X-Report-Cache"] == "stale"
+        assert response.content == built_content
+        assert restarted_client.get("/report/", params={"months": 3}).status_code == (
+            503
+        )
+        refreshed.set()
+        deadline = time.monotonic() + 10
+        while main.latest_reports and time.monotonic() < deadline:
+            time.sleep(0.05)
+        response = restarted_client.get("/report/")
+        assert response.headers["X-Report-Cache"] == "hit"
+        assert response.content != built_content
+        assert report_snapshots.get_latest("sql")[1] == response.content
+    empty_table(test_db)
+
+
+def test_failed_report_refresh_stops_serving_the_latest_report(
+    stub_api, report_snapshots
+):
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    built_content = client.get("/report/").content
+    empty_table(test_db)
+    stub_api.error = (500, "Internal Server Error")
+    with TestClient(app) as restarted_client:
+        deadline = time.monotonic() + 10
+        while main.latest_reports and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not main.latest_reports
+        stub_api.error = None
+        stub_api.items = create_items(10)
+        restarted_client.post(
+            "/load_applications/", params={"mode": "full", "wait": True}
+        )
+        response = restarted_client.get("/report/")
+        assert response.headers["X-Report-Cache"] == "miss"
+        assert response.content != built_content
+    empty_table(test_db)
+
+
+def test_concurrent_reports_are_built_once(monkeypatch, stub_api):
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    builds, emptiness_checks = [], []
+    build_and_cache_report, is_empty = main.build_and_cache_report, main.is_empty
+
+    def slow_build(db, backend, parameters):
+        builds.append((backend, parameters))
+        time.sleep(0.3)
+        return build_and_cache_report(db, backend, parameters)
+
+    def count_emptiness_check(db):
+        emptiness_checks.append(db)
+        return is_empty(db)
+
+    monkeypatch.setattr("main.build_and_cache_report", slow_build)
+    monkeypatch.setattr("main.is_empty", count_emptiness_check)
+
+    async def request_reports(num_of_requests: int):
+        async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+            return await asyncio.gather(
+                *(async_client.get("/report/") for _ in range(num_of_requests))
+            )
+
+    responses = asyncio.run(request_reports(20))
+    assert len(builds) == 1
+    assert len(emptiness_checks) == 1
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.content for response in responses}) == 1
+    assert sorted(response.headers["X-Report-Cache"] for response in responses) == [
+        "coalesced"
+    ] * 19 + ["miss"]
+    assert main.report_builds.joined >= 19
+    assert len(main.report_builds) == 0
+    empty_table(test_db)
+
+
+def test_report_builds_are_capped(monkeypatch, stub_api):
+    client.post("/load_applications/", params={"mode": "full", "wait": True})
+    release = threading.Event()
+    build_and_cache_report = main.build_and_cache_report
+
+    def blocked_build(*args):
+        release.wait(10)
+        return build_and_cache_report(*args)
+
+    monkeypatch.setattr("main.build_and_cache_report", blocked_build)
+    monkeypatch.setattr(
+        "main.report_builds", SingleFlight(ThreadPoolExecutor(1), max_calls=1)
+    )
+
+    async def request_reports():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+            first_request = asyncio.create_task(async_client.get("/report/"))
+            while len(main.report_builds) == 0:
+                await asyncio.sleep(0.01)
+            rejected_response = await async_client.get("/report/", params={"months": 3})
+            release.set()
+            return await first_request, rejected_response
+
+    first_response, rejected_response = asyncio.run(request_reports())
+    assert first_response.status_code == 200
+    assert rejected_response.status_code == 503
+    assert rejected_response.headers["Retry-After"] == "1"
+    assert main.report_builds.rejected == 1
+    assert client.get("/report/", params={"months": 3}).status_code == 200
+    empty_table(test_db)
+
+
+def slow_down_load(monkeypatch, seconds_per_page: float):
+    """Loads pages of two applications, each saved after sleeping a while."""
+    save_page = main.save_page
+
+    def slow_save_page(*args):
+        time.sleep(seconds_per_page)
+        save_page(*args)
+
+    monkeypatch.setattr("main.save_page", slow_save_page)
+    monkeypatch.setattr("main.API_PAGE_SIZE", 2)
+
+
+def test_root_stays_responsive_during_load(monkeypatch, stub_api):
+    slow_down_load(monkeypatch, 0.2)
+    stub_api.items = create_items(10)
+
+    async def measure_root_latencies_during_load():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            load = asyncio.ensure_future(
+                client.post("/load_applications/", params={"wait": True})
+            )
+            latencies = []
+            while not load.done():
+                start = time.perf_counter()
+                response = await client.get("/")
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+                await asyncio.sleep(0.005)
+            assert (await load).status_code == 200
+            return sorted(latencies)
+
+    latencies = asyncio.run(measure_root_latencies_during_load())
+    assert len(latencies) > 50
+    assert latencies[int(len(latencies) * 0.99)] < 0.1
+    empty_table(test_db)
+
+
+def wait_for_job(job_id: str, timeout: float = 10) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/load_applications/{job_id}").json()
+        if job["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+def test_load_applications_in_background(monkeypatch, stub_api):
+    slow_down_load(monkeypatch, 0.1)
+    stub_api.items = create_items(7)
+    response = client.post("/load_applications/", params={"mode": "full"})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert response.headers["Location"] == f"/load_applications/{job_id}"
+    duplicate_response = client.post("/load_applications/", params={"mode": "full"})
+    assert duplicate_response.status_code == 202
+    assert duplicate_response.json()["job_id"] == job_id
+    conflicting_response = client.post("/load_applications/")
+    assert conflicting_response.status_code == 409
+    assert conflicting_response.json()["detail"]["job_id"] == job_id
+
+    job = wait_for_job(job_id)
+    assert job["status"] == "succeeded"
+    assert job["mode"] == "full"
+    assert (job["pages_fetched"], job["total_pages"]) == (4, 4)
+    assert job["rows_written"] == job["total_rows"] == 7
+    assert job["rows_per_second"] > 0
+    assert job["result"]["inserted"] == 7
+    assert stub_api.requested_skips.count(0) == 1
+    empty_table(test_db)
+
+
+def test_full_load_conflicts_with_running_incremental_load(monkeypatch, stub_api):
+    slow_down_load(monkeypatch, 0.1)
+    stub_api.items = create_items(5)
+    job_id = client.post("/load_applications/").json()["job_id"]
+    response = client.post("/load_applications/", params={"mode": "full"})
+    assert response.status_code == 409
+    assert response.json()["detail"]["job_id"] == job_id
+    assert wait_for_job(job_id)["status"] == "succeeded"
+    response = client.post("/load_applications/", params={"mode": "full"})
+    assert response.status_code == 202
+    assert response.json()["job_id"] != job_id
+    wait_for_job(response.json()["job_id"])
+    empty_table(test_db)
+
+
+def test_failed_load_job_reports_error(stub_api):
+    stub_api.error = (400, "Bad Request")
+    job_id = client.post("/load_applications/").json()["job_id"]
+    job = wait_for_job(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == {
+        "status_code": 400,
+        "detail": "There was a problem trying to access the API: Bad Request",
+    }
+
+
+def test_get_unknown_load_job():
+    assert client.get("/load_applications/unknown").status_code == 404
+
+
 def test_report_on_db(test_applications):
     assert_report()
 
 
-def test_report_on_empty_db(test_applications):
+def test_report_on_empty_db(stub_api):
     """
     This is a bit of an all-round test, in a real-world scenario I’d hope to
      test all the functions and endpoints separately and isolated.
      However considering time constraints I will add that as a todo.
     """
     empty_table(test_db)
-    assert_report()
+    response = client.get("/report/")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    job = wait_for_job(response.json()["job_id"])
+    assert job["status"] == "succeeded"
+    response = client.get("/report/")
+    assert response.status_code == 200
+    assert Report.parse_raw(response.content)
+    empty_table(test_db)
 
 
 def assert_report():
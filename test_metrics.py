@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    get_statement_label,
+    instrument_engine,
+)
+
+
+def test_counter_and_gauge():
+    registry = Registry()
+    rows = registry.register(Counter("rows_total", "Rows written.", ["mode"]))
+    rate = registry.register(Gauge("rate", "Rows per second."))
+    registry.register(Gauge("entries", "Cached entries.", callback=lambda: 3))
+    rows.inc(5, mode="full")
+    rows.inc(2, mode="full")
+    rate.set(1.5)
+    assert registry.render() == (
+        "# HELP rows_total Rows written.\n"
+        "# TYPE rows_total counter\n"
+        'rows_total{mode="full"} 7\n'
+        "# HELP rate Rows per second.\n"
+        "# TYPE rate gauge\n"
+        "rate 1.5\n"
+        "# HELP entries Cached entries.\n"
+        "# TYPE entries gauge\n"
+        "entries 3\n"
+    )
+
+
+def test_histogram():
+    histogram = Histogram("seconds", "Durations.", ["section"], buckets=[0.1, 1])
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value, section='a "b"')
+    assert histogram.render().splitlines()[2:] == [
+        'seconds_bucket{section="a \\"b\\"",le="0.1"} 2',
+        'seconds_bucket{section="a \\"b\\"",le="1.0"} 3',
+        'seconds_bucket{section="a \\"b\\"",le="+Inf"} 4',
+        'seconds_sum{section="a \\"b\\""} 2.65',
+        'seconds_count{section="a \\"b\\""} 4',
+    ]
+    assert histogram.get_count(section='a "b"') == 4
+
+
+def test_labels_have_to_match():
+    with pytest.raises(ValueError):
+        Counter("rows_total", "Rows written.", ["mode"]).inc(1, kind="full")
+    registry = Registry()
+    registry.register(Gauge("rate", "Rows per second."))
+    with pytest.raises(ValueError):
+        registry.register(Gauge("rate", "Rows per second."))
+
+
+def test_get_statement_label():
+    assert get_statement_label("SELECT a FROM applications WHERE b") == (
+        "SELECT applications"
+    )
+    assert get_statement_label("INSERT INTO monthly_rollup (a) VALUES (?)") == (
+        "INSERT monthly_rollup"
+    )
+    assert get_statement_label('UPDATE "sync_state" SET a=?') == "UPDATE sync_state"
+    assert get_statement_label("BEGIN") == "BEGIN"
+
+
+def test_instrument_engine():
+    engine = create_engine("sqlite://")
+    histogram = Histogram("sql_seconds", "Statement durations.", ["statement"])
+    instrument_engine(engine, histogram)
+    with engine.connect() as connection:
+        connection.execute(text("CREATE TABLE item (id INTEGER)"))
+        connection.execute(text("SELECT id FROM item"))
+        connection.execute(text("SELECT id FROM item"))
+        with pytest.raises(Exception):
+            connection.execute(text("SELECT id FROM missing"))
+    assert histogram.get_count(statement="SELECT item") == 2
+    assert histogram.get_count(statement="CREATE item") == 1